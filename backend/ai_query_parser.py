@@ -1,25 +1,83 @@
 from mo_sql_parsing import parse
 
+def _like_pattern(value):
+    """(columna, patrón) de un nodo LIKE."""
+    if isinstance(value, list) and len(value) == 2:
+        column, literal = value
+        if isinstance(literal, dict) and "literal" in literal:
+            literal = literal["literal"]
+        return (column if isinstance(column, str) else None), str(literal)
+    return None, str(value)
+
+
 def extract_keywords(where):
     if isinstance(where, dict):
         if "like" in where:
-            value = where["like"]
-            if isinstance(value, list) and len(value) == 2:
-                literal = value[1]
-                if isinstance(literal, dict) and "literal" in literal:
-                    return str(literal["literal"])
-                return str(literal)
-            return str(value)
+            return _like_pattern(where["like"])[1]
         elif "and" in where:
             return " ".join(extract_keywords(w) for w in where["and"])
         elif "or" in where:
             return " ".join(extract_keywords(w) for w in where["or"])
     return ""
 
+COMPARISONS = ("eq", "neq", "gt", "gte", "lt", "lte", "in", "between")
+
+
+def _constant(value):
+    """Valor literal de una comparación; None si es otra columna o una expresión."""
+    if isinstance(value, dict) and "literal" in value:
+        value = value["literal"]
+    elif isinstance(value, (str, dict)):
+        return None
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+
+def _comparison(op, args):
+    """("cmp", op, columna, valor) de un predicado sobre la metadata, o None."""
+    if not isinstance(args, list) or len(args) < 2 or not isinstance(args[0], str):
+        return None
+    values = [_constant(v) for v in args[1:]]
+    if any(v is None for v in values):
+        return None
+    if op == "between":
+        return ("cmp", op, args[0], tuple(values)) if len(values) == 2 else None
+    value = values[0]
+    if op == "in":
+        value = value if isinstance(value, tuple) else (value,)
+    elif isinstance(value, tuple):
+        return None
+    return ("cmp", op, args[0], value)
+
+
+def extract_plan(where):
+    """
+    Árbol booleano del WHERE: ("like", columna, patrón), ("cmp", op, columna,
+    valor) para comparaciones con constantes, ("and", hijos) u ("or", hijos).
+    Los demás predicados se ignoran; devuelve None si no queda ninguno.
+    """
+    if not isinstance(where, dict):
+        return None
+    if "like" in where:
+        column, pattern = _like_pattern(where["like"])
+        return ("like", column, pattern)
+    for op in COMPARISONS:
+        if op in where:
+            return _comparison(op, where[op])
+    for op in ("and", "or"):
+        if op in where:
+            children = [extract_plan(w) for w in where[op]]
+            children = [c for c in children if c is not None]
+            if not children:
+                return None
+            return children[0] if len(children) == 1 else (op, tuple(children))
+    return None
+
+
 def parse_sql_query(sql_query: str):
     try:
         parsed = parse(sql_query)
-        print("QUERY PARSEADA: ", parsed)
         table_name = parsed.get("from") or parsed.get("FROM") or "Audio"
         limit = parsed.get("limit") or parsed.get("LIMIT") or 5
         where_clause = parsed.get("where") or parsed.get("WHERE") or {}
@@ -40,9 +98,10 @@ def parse_sql_query(sql_query: str):
 
         query_text_raw = extract_keywords(where_clause)
         query_text = " ".join(str(query_text_raw).split())
+        plan = extract_plan(where_clause)
 
-        return table_name, query_text, limit, selected_fields
+        return table_name, query_text, limit, selected_fields, plan
 
     except Exception as e:
         print(f"❌ Error parseando SQL: {e}")
-        return "", "", 5, []
+        return "", "", 5, [], None
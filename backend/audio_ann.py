@@ -0,0 +1,88 @@
+"""
+Búsqueda aproximada (IVF) sobre los vectores TF-IDF normalizados del índice
+acústico.
+
+Los documentos se agrupan con k-means en n_lists listas; cada lista guarda
+sus vectores contiguos. Una consulta compara contra los centroides, recorre
+sólo las n_probe listas más cercanas y devuelve el top-k por coseno dentro de
+ellas. Con n_probe = n_lists el resultado es exacto; bajar n_probe cambia
+recall por latencia.
+
+En disco es un directorio con un .npy por arreglo (se abren con mmap) y un
+meta.json con los parámetros.
+"""
+import json
+import os
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.preprocessing import normalize
+
+ARRAYS = ("centroids", "offsets", "docs", "vectors")
+
+
+class IVFIndex:
+    def __init__(self, n_lists=64, n_probe=8, seed=0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.seed = seed
+        self.centroids = None  # (n_lists, dim) normalizados
+        self.offsets = None    # inicio de cada lista en docs/vectors, n_lists + 1
+        self.docs = None       # posición del documento en el índice acústico
+        self.vectors = None    # vectores float32 ordenados por lista
+
+    def build(self, matrix):
+        """matrix: TF-IDF (docs, codewords), dispersa o densa."""
+        vectors = normalize(matrix).astype(np.float32)
+        vectors = vectors.toarray() if hasattr(vectors, "toarray") else np.asarray(vectors)
+        n_lists = max(1, min(self.n_lists, len(vectors)))
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, random_state=self.seed, n_init=3,
+                                 batch_size=4096)
+        labels = kmeans.fit_predict(vectors)
+
+        self.n_lists = n_lists
+        self.centroids = normalize(kmeans.cluster_centers_).astype(np.float32)
+        order = np.argsort(labels, kind="stable")
+        self.docs = order.astype(np.int32)
+        self.vectors = np.ascontiguousarray(vectors[order])
+        self.offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(np.bincount(labels, minlength=n_lists))
+        return self
+
+    def search(self, query, k=5, n_probe=None):
+        """query: vector TF-IDF de la consulta. Devuelve [(posición, score)]."""
+        query = np.asarray(query, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        if norm == 0 or k <= 0:
+            return []
+        query = query / norm
+
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        closest = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+        ranges = [(self.offsets[c], self.offsets[c + 1]) for c in closest]
+        rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+        if len(rows) == 0:
+            return []
+
+        scores = self.vectors[rows] @ query
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        docs = self.docs[rows[top]]
+        # A igual score gana el doc de menor posición.
+        order = np.lexsort((docs, -scores[top]))
+        return [(int(docs[i]), float(scores[top][i])) for i in order]
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(path, name + ".npy"), getattr(self, name))
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"n_lists": self.n_lists, "n_probe": self.n_probe, "seed": self.seed}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        index = cls(**meta)
+        for name in ARRAYS:
+            setattr(index, name, np.load(os.path.join(path, name + ".npy"), mmap_mode="r"))
+        return index
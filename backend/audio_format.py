@@ -0,0 +1,74 @@
+"""
+Formato en disco del índice acústico: un directorio con un .npy por arreglo,
+todos abiertos con np.load(mmap_mode="r"). Abrir el índice no lee los datos
+y varios procesos comparten las mismas páginas.
+
+    meta.json            {"format": "boaw", "version": 1, "n_clusters",
+                          "n_mfcc", "hop_length", "n_docs"}
+    centroids.npy        float32 (n_clusters, n_mfcc)  diccionario acústico
+    idf.npy              float64 (n_clusters,)         IDF de cada codeword
+    tfidf_data.npy       \
+    tfidf_indices.npy     } CSR (n_docs, n_clusters) con el TF-IDF normalizado
+    tfidf_indptr.npy     /
+    postings_data.npy    \
+    postings_indices.npy  } la misma matriz en CSC: una lista por codeword
+    postings_indptr.npy  /
+    doc_norms.npy        float64 (n_docs,)
+    doc_ids.npy          unicode (n_docs,)
+    ivf/                 índice aproximado opcional (ver audio_ann.py)
+
+No depende de la versión de scikit-learn: el diccionario son sólo centroides.
+"""
+import json
+import os
+import shutil
+import uuid
+import numpy as np
+
+FORMAT = "boaw"
+VERSION = 1
+META = "meta.json"
+ARRAYS = (
+    "centroids", "idf",
+    "tfidf_data", "tfidf_indices", "tfidf_indptr",
+    "postings_data", "postings_indices", "postings_indptr",
+    "doc_norms", "doc_ids",
+)
+
+
+def write_index(path, meta, arrays, extra=None):
+    """
+    Escribe el índice en un directorio temporal y lo cambia por el anterior.
+    extra(tmp_dir) permite agregar subdirectorios (p. ej. el IVF) antes del cambio.
+    """
+    path = path.rstrip("/\\")
+    tmp_dir = f"{path}.tmp-{uuid.uuid4().hex}"
+    os.makedirs(tmp_dir)
+    for name in ARRAYS:
+        np.save(os.path.join(tmp_dir, name + ".npy"), arrays[name])
+    if extra is not None:
+        extra(tmp_dir)
+    # meta.json se escribe al final: un directorio sin él está incompleto.
+    with open(os.path.join(tmp_dir, META), "w", encoding="utf-8") as f:
+        json.dump({"format": FORMAT, "version": VERSION, **meta}, f, indent=2)
+
+    old_dir = None
+    if os.path.exists(path):
+        old_dir = f"{path}.old-{uuid.uuid4().hex}"
+        os.replace(path, old_dir)
+    os.replace(tmp_dir, path)
+    if old_dir is not None:
+        # Los procesos que ya tienen los .npy mapeados los siguen viendo.
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def read_index(path):
+    """(meta, {nombre: arreglo mapeado}). Falla si la versión no coincide."""
+    with open(os.path.join(path, META), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format") != FORMAT or meta.get("version") != VERSION:
+        raise ValueError(
+            f"Índice acústico con formato no soportado: {meta.get('format')} v{meta.get('version')}"
+        )
+    arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in ARRAYS}
+    return meta, arrays
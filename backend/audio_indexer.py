@@ -2,22 +2,95 @@ import librosa
 import numpy as np
 import os
 import pickle
-from sklearn.cluster import KMeans
+import time
+import scipy.sparse as sp
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.feature_extraction.text import TfidfTransformer
 from sklearn.preprocessing import normalize
 from sklearn.metrics.pairwise import cosine_similarity
-from collections import defaultdict, Counter
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
+from backend.audio_ann import IVFIndex
+from backend.audio_format import read_index, write_index
+
+
+def peak_rss_mb():
+    """Pico de memoria residente del proceso en MB (None si el SO no lo expone)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # En Linux ru_maxrss viene en KB.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Copia del indexador en cada proceso del pool de extracción.
+_worker = None
+
+
+def _init_worker(indexer):
+    global _worker
+    _worker = indexer
+
+
+def _song_task(path, histogram):
+    """
+    _song_result en el worker, más los aciertos y extracciones del cache de
+    MFCC de esta canción: los contadores del worker no son los del proceso
+    principal, que los suma en _ordered_results.
+    """
+    cache = _worker.feature_cache
+    if cache is None:
+        return _song_result(_worker, path, histogram), (0, 0)
+    hits, misses = cache.hits, cache.misses
+    result = _song_result(_worker, path, histogram)
+    return result, (cache.hits - hits, cache.misses - misses)
+
+
+def _song_result(indexer, path, histogram):
+    """(resultado, None) o (None, error): un audio dañado no aborta la construcción."""
+    try:
+        return indexer.song_features(path, histogram), None
+    except Exception as e:
+        return None, f"{path}: {e}"
+
 
 class AudioIndexer:
-    def __init__(self, n_clusters=256):
+    def __init__(self, n_clusters=256, n_mfcc=13, hop_length=512, feature_cache=None, n_workers=1):
         self.kmeans = KMeans(n_clusters=n_clusters)
         self.tfidf_transformer = TfidfTransformer()
         self.n_clusters = n_clusters
         self.histograms = {}
         self.doc_ids = []
-        self.index_invertido = defaultdict(list)
         self.tfidf_matrix = None
+        # Lo que usan las consultas: centroides del diccionario e IDF por codeword.
+        # KMeans y TfidfTransformer sólo se usan para entrenar.
+        self.centroids = None
+        self.idf = None
+        # Arreglos mapeados desde disco cuando el índice se abre con load().
+        self._arrays = None
+        # Índice invertido vectorizado: matriz TF-IDF en CSC (una columna por
+        # codeword) y norma de cada documento.
+        self.postings = None
+        self.doc_norms = None
+        # Índice aproximado opcional (ver build_ann).
+        self.ann = None
+        self.n_mfcc = n_mfcc
+        self.hop_length = hop_length
+        # FeatureCache opcional para no decodificar dos veces las canciones del índice.
+        self.feature_cache = feature_cache
+        # Con n_workers > 1 la decodificación y los MFCC corren en un pool de procesos.
+        self.n_workers = max(1, n_workers or 1)
+
+    def mfcc_params(self):
+        return {"n_mfcc": self.n_mfcc, "hop_length": self.hop_length, "sr": None}
+
+    def load_features(self, path):
+        """MFCC de una canción del índice, desde el cache si está configurado."""
+        if self.feature_cache is None:
+            return self.extract_mfccs(path)
+        return self.feature_cache.get(path, self.extract_mfccs, self.mfcc_params())
 
     def extract_mfccs(self, path):
         try:
@@ -25,18 +98,130 @@ class AudioIndexer:
         except Exception as e:
             raise RuntimeError(f"Error al cargar el audio con librosa: {e}")
 
-        mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13, hop_length=512)
+        mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=self.n_mfcc, hop_length=self.hop_length)
         return mfcc.T  # (frames, 13)
 
+    def song_features(self, path, histogram=False):
+        """MFCC de la canción o, con histogram=True, su histograma de codewords."""
+        mfccs = self.load_features(path)
+        if not histogram:
+            return np.asarray(mfccs)
+        return np.bincount(self.predict(mfccs), minlength=self.n_clusters)
+
+    def predict(self, mfccs):
+        """Codeword (centroide más cercano) de cada frame."""
+        mfccs = np.asarray(mfccs, dtype=np.float32)
+        # |x - c|^2 = |x|^2 - 2 x·c + |c|^2; |x|^2 no cambia el argmin.
+        dist = (self.centroids ** 2).sum(axis=1) - 2 * (mfccs @ self.centroids.T)
+        return np.argmin(dist, axis=1)
+
+    def _worker_copy(self):
+        # Sólo lo necesario para extraer y asignar codewords.
+        copy = AudioIndexer(self.n_clusters, self.n_mfcc, self.hop_length, self.feature_cache)
+        copy.centroids = self.centroids
+        return copy
+
+    def _map_songs(self, songs, histogram=False):
+        """
+        songs: [(clave, path), ...]. Genera (clave, resultado) en el mismo
+        orden, saltando los audios que fallan. Con varios workers hay a lo
+        sumo 2 * n_workers canciones en vuelo, para no acumular resultados.
+        """
+        paths = [path for _, path in songs]
+        if self.n_workers <= 1:
+            results = (_song_result(self, path, histogram) for path in paths)
+            pending = None
+        else:
+            pool = ProcessPoolExecutor(max_workers=self.n_workers, initializer=_init_worker,
+                                       initargs=(self._worker_copy(),))
+            pending = deque()
+            results = self._ordered_results(pool, paths, histogram, pending)
+
+        try:
+            for (key, _), (result, error) in zip(songs, results):
+                if error is not None:
+                    print(f"⚠️ Se omite {error}")
+                    continue
+                yield key, result
+        finally:
+            if pending is not None:
+                for future in pending:
+                    future.cancel()
+                pool.shutdown()
+
+    def _ordered_results(self, pool, paths, histogram, pending):
+        max_in_flight = 2 * self.n_workers
+        for path in paths:
+            pending.append(pool.submit(_song_task, path, histogram))
+            if len(pending) >= max_in_flight:
+                yield self._collect(pending.popleft())
+        while pending:
+            yield self._collect(pending.popleft())
+
+    def _collect(self, future):
+        result, (hits, misses) = future.result()
+        if self.feature_cache is not None:
+            self.feature_cache.hits += hits
+            self.feature_cache.misses += misses
+        return result
+
     def fit_dictionary(self, audio_paths):
         print("Extrayendo descriptores locales para clustering...")
+        songs = [(path, path) for path in audio_paths]
         all_mfccs = []
-        for path in tqdm(audio_paths):
-            mfccs = self.extract_mfccs(path)
+        for _, mfccs in tqdm(self._map_songs(songs), total=len(songs)):
             all_mfccs.append(mfccs)
         all_mfccs = np.vstack(all_mfccs)
         print(f"Clustering {all_mfccs.shape[0]} vectores MFCC...")
         self.kmeans.fit(all_mfccs)
+        self.centroids = self.kmeans.cluster_centers_.astype(np.float32)
+
+    def fit_dictionary_streaming(self, audio_paths, memory_mb=256, batch_size=4096, seed=0):
+        """
+        Entrena el diccionario sin juntar todos los frames en memoria: las
+        canciones se recorren una a una y se conserva una muestra uniforme de
+        frames (reservoir sampling) que ocupa a lo sumo memory_mb. Sobre esa
+        muestra se entrena MiniBatchKMeans. Devuelve tiempos y pico de RSS.
+        """
+        capacity = max(self.n_clusters, int(memory_mb * 1024 * 1024) // (4 * self.n_mfcc))
+        reservoir = np.empty((capacity, self.n_mfcc), dtype=np.float32)
+        rng = np.random.default_rng(seed)
+        seen = 0
+
+        t0 = time.time()
+        print("Muestreando descriptores locales para clustering...")
+        songs = [(path, path) for path in audio_paths]
+        for _, mfccs in tqdm(self._map_songs(songs), total=len(songs)):
+            m = len(mfccs)
+            fill = min(max(capacity - seen, 0), m)
+            reservoir[seen:seen + fill] = mfccs[:fill]
+            # Algoritmo R: el frame número t reemplaza a uno al azar con prob. capacity / t.
+            t = seen + np.arange(fill + 1, m + 1)
+            slots = (rng.random(len(t)) * t).astype(np.int64)
+            keep = slots < capacity
+            reservoir[slots[keep]] = mfccs[fill:][keep]
+            seen += m
+        sample = reservoir[:min(seen, capacity)]
+        t_sample = time.time() - t0
+
+        print(f"Clustering {len(sample)} de {seen} vectores MFCC (MiniBatchKMeans)...")
+        t0 = time.time()
+        self.kmeans = MiniBatchKMeans(n_clusters=self.n_clusters, batch_size=batch_size,
+                                      random_state=seed, n_init=3)
+        self.kmeans.fit(sample)
+        self.centroids = self.kmeans.cluster_centers_.astype(np.float32)
+        t_cluster = time.time() - t0
+
+        stats = {
+            "frames_seen": seen,
+            "frames_sampled": len(sample),
+            "sample_mb": round(sample.nbytes / (1024 * 1024), 2),
+            "sampling_s": round(t_sample, 2),
+            "clustering_s": round(t_cluster, 2),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        print(f"✅ Diccionario entrenado: {stats}")
+        return stats
 
     def build_bow(self, audio_files_dict):
         """
@@ -44,78 +229,169 @@ class AudioIndexer:
         """
         print("Construyendo BoAW para cada audio...")
         docs = []
-        self.doc_ids = list(audio_files_dict.keys())
+        self.doc_ids = []
+        songs = list(audio_files_dict.items())
 
-        for doc_id, path in tqdm(audio_files_dict.items()):
-            mfccs = self.extract_mfccs(path)
-            labels = self.kmeans.predict(mfccs)
-            histogram = np.bincount(labels, minlength=self.n_clusters)
+        for doc_id, histogram in tqdm(self._map_songs(songs, histogram=True), total=len(songs)):
+            self.doc_ids.append(doc_id)
             self.histograms[doc_id] = histogram
             docs.append(histogram)
-
-            # Para índice invertido acústico
-            counts = Counter(labels)
-            for word_id, freq in counts.items():
-                self.index_invertido[word_id].append((doc_id, freq))
         
         print(f"✅ Histogramas BoW generados: {len(self.histograms)} documentos.")
         docs = np.array(docs)
-        self.tfidf_matrix = self.tfidf_transformer.fit_transform(docs)
+        self.tfidf_matrix = self.tfidf_transformer.fit_transform(docs).tocsr()
+        self.idf = self.tfidf_transformer.idf_
+        # Índice invertido acústico: la misma matriz por codeword.
+        self._build_postings()
         print(f"✅ TF-IDF entrenado sobre {self.tfidf_matrix.shape[0]} documentos.")
 
-    def save(self, path="multimedia/audio_index.pkl"):
-        with open(path, "wb") as f:
-            pickle.dump({
-                "kmeans": self.kmeans,
-                "doc_ids": self.doc_ids,
-                "tfidf_matrix": self.tfidf_matrix,
-                "index_invertido": self.index_invertido,
-                "tfidf_transformer": self.tfidf_transformer 
-            }, f)
+    def _build_postings(self):
+        self.postings = self.tfidf_matrix.tocsc()
+        self.doc_norms = np.sqrt(np.asarray(self.tfidf_matrix.multiply(self.tfidf_matrix).sum(axis=1)).ravel())
+
+    def build_ann(self, n_lists=64, n_probe=8, seed=0):
+        """Construye el índice IVF sobre la matriz TF-IDF ya calculada."""
+        self.ann = IVFIndex(n_lists=n_lists, n_probe=n_probe, seed=seed).build(self.tfidf_matrix)
+        return self.ann
+
+    def save(self, path="multimedia/audio_index"):
+        """Guarda el índice en el formato de audio_format.py."""
+        meta = {
+            "n_clusters": self.n_clusters,
+            "n_mfcc": self.n_mfcc,
+            "hop_length": self.hop_length,
+            "n_docs": len(self.doc_ids),
+        }
+        arrays = {
+            "centroids": np.asarray(self.centroids, dtype=np.float32),
+            "idf": np.asarray(self.idf, dtype=np.float64),
+            "tfidf_data": self.tfidf_matrix.data,
+            "tfidf_indices": self.tfidf_matrix.indices,
+            "tfidf_indptr": self.tfidf_matrix.indptr,
+            "postings_data": self.postings.data,
+            "postings_indices": self.postings.indices,
+            "postings_indptr": self.postings.indptr,
+            "doc_norms": self.doc_norms,
+            "doc_ids": np.array([str(d) for d in self.doc_ids]),
+        }
+
+        def save_ann(tmp_dir):
+            if self.ann is not None:
+                self.ann.save(os.path.join(tmp_dir, "ivf"))
+
+        write_index(path, meta, arrays, extra=save_ann)
         print(f"✅ Índice guardado en {path}")
 
-    def load(self, path="multimedia/audio_index.pkl"):
+    def load(self, path="multimedia/audio_index"):
+        if path.endswith(".pkl"):
+            return self._load_pickle(path)
+        meta, arrays = read_index(path)
+        self.n_clusters = meta["n_clusters"]
+        self.n_mfcc = meta["n_mfcc"]
+        self.hop_length = meta["hop_length"]
+        self.centroids = arrays["centroids"]
+        self.idf = arrays["idf"]
+        shape = (meta["n_docs"], meta["n_clusters"])
+        self.tfidf_matrix = sp.csr_matrix(
+            (arrays["tfidf_data"], arrays["tfidf_indices"], arrays["tfidf_indptr"]), shape=shape)
+        self.postings = sp.csc_matrix(
+            (arrays["postings_data"], arrays["postings_indices"], arrays["postings_indptr"]), shape=shape)
+        self.doc_norms = arrays["doc_norms"]
+        self.doc_ids = arrays["doc_ids"]
+        self._arrays = arrays
+        ann_dir = os.path.join(path, "ivf")
+        self.ann = IVFIndex.load(ann_dir) if os.path.isdir(ann_dir) else None
+
+    def _load_pickle(self, path):
+        # Índices .pkl anteriores al formato de audio_format.py.
         with open(path, "rb") as f:
             data = pickle.load(f)
             self.kmeans = data["kmeans"]
             self.doc_ids = data["doc_ids"]
-            self.tfidf_matrix = data["tfidf_matrix"]
-            self.index_invertido = data["index_invertido"]
+            self.tfidf_matrix = data["tfidf_matrix"].tocsr()
             self.tfidf_transformer = data["tfidf_transformer"] 
             self.n_clusters = self.kmeans.n_clusters
-        
-    def knn_secuencial(self, query_path, k=5):
-        if not hasattr(self.tfidf_transformer, 'idf_'):
-            raise RuntimeError("TfidfTransformer no está entrenado.")
+        self.centroids = self.kmeans.cluster_centers_.astype(np.float32)
+        self.idf = self.tfidf_transformer.idf_
+        self._build_postings()
+
+    def memory_footprint(self):
+        # Cota superior para IndexRegistry: todos los arreglos residentes.
+        if self._arrays is None:
+            return sum(m.data.nbytes + m.indices.nbytes for m in (self.tfidf_matrix, self.postings))
+        return sum(a.nbytes for a in self._arrays.values())
 
+    @classmethod
+    def from_file(cls, path="multimedia/audio_index"):
+        """Abre un índice guardado (para IndexRegistry)."""
+        indexer = cls()
+        indexer.load(path)
+        return indexer
+
+    def encode_query(self, query_path):
+        """
+        Histograma BoAW de un audio de consulta. Se calcula una vez y se pasa
+        a knn_secuencial / knn_invertido en lugar de la ruta.
+        """
         mfccs = self.extract_mfccs(query_path)
-        labels = self.kmeans.predict(mfccs)
-        hist = np.bincount(labels, minlength=self.n_clusters).reshape(1, -1)
-        hist_tfidf = self.tfidf_transformer.transform(hist)
+        return np.bincount(self.predict(mfccs), minlength=self.n_clusters)
+
+    def _query_histogram(self, query):
+        # query puede ser la ruta del audio o un histograma de encode_query.
+        if isinstance(query, (str, os.PathLike)):
+            return self.encode_query(query)
+        return np.asarray(query)
+
+    def _tfidf(self, hist):
+        """TF-IDF normalizado de un histograma (como TfidfTransformer.transform)."""
+        weights = np.asarray(hist, dtype=np.float64).ravel() * self.idf
+        norm = np.sqrt(weights @ weights)
+        if norm > 0:
+            weights /= norm
+        return sp.csr_matrix(weights.reshape(1, -1))
+
+    def knn_secuencial(self, query, k=5):
+        if self.idf is None:
+            raise RuntimeError("TfidfTransformer no está entrenado.")
+
+        hist_tfidf = self._tfidf(self._query_histogram(query))
         sims = cosine_similarity(hist_tfidf, self.tfidf_matrix)[0]
         top_k = np.argsort(sims)[::-1][:k]
         return [(self.doc_ids[i], sims[i]) for i in top_k]
 
-    def knn_invertido(self, query_path, k=5):
-
-        mfccs = self.extract_mfccs(query_path)
-        labels = self.kmeans.predict(mfccs)
-        query_hist = Counter(labels)
-        scores = defaultdict(float)
+    def knn_invertido(self, query, k=5):
+        """
+        Coseno TF-IDF (el mismo ranking que knn_secuencial) recorriendo sólo
+        las columnas de los codewords presentes en la consulta.
+        """
+        q = self._tfidf(self._query_histogram(query))
+        q_norm = np.sqrt(q.data @ q.data)
+        if q_norm == 0:
+            return []
 
-        for word_id, freq in query_hist.items():
-            for doc_id, tf in self.index_invertido.get(word_id, []):
-                scores[doc_id] += tf * freq  # TF-TF score simple
+        # Producto matriz-vector disperso: sólo columnas con peso en la consulta.
+        scores = self.postings[:, q.indices] @ (q.data / q_norm)
+        scores = scores / np.maximum(self.doc_norms, 1e-12)
 
-        if not scores:
+        k = min(k, len(scores))
+        if k <= 0:
             return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        # A igual score gana el doc de menor posición.
+        top = top[np.lexsort((top, -scores[top]))]
+        return [(self.doc_ids[i], scores[i]) for i in top]
 
-        scores = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-        return scores[:k]
+    def knn_ann(self, query, k=5, n_probe=None):
+        """Top-k aproximado con el índice IVF (mismo coseno que knn_secuencial)."""
+        if self.ann is None:
+            raise RuntimeError("El índice aproximado no está construido (build_ann).")
+        q = self._tfidf(self._query_histogram(query)).toarray()[0]
+        return [(self.doc_ids[i], score) for i, score in self.ann.search(q, k, n_probe)]
 
 
 # fit_dictionary(audio_paths) → construye KMeans
 # build_bow({doc_id: path}) → genera histograma y TF-IDF
 # knn_secuencial(query_path) → búsqueda con similitud coseno
 # knn_invertido(query_path) → búsqueda con índice invertido acústico
+# build_ann() / knn_ann(query_path) → búsqueda aproximada con IVF
 # save() / load() para reusar modelos
\ No newline at end of file
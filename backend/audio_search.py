@@ -0,0 +1,107 @@
+"""
+Búsqueda por audio fuera del event loop.
+
+Decodificar, extraer MFCC y buscar es trabajo de CPU de varios segundos; si
+corre dentro de un endpoint async bloquea todas las demás requests (también
+las de texto). AudioSearchPool lo manda a un pool de procesos propio. Cada
+proceso mantiene el índice acústico abierto entre consultas. Cuando ya hay
+max_pending búsquedas en curso o en cola, las nuevas se rechazan de inmediato
+en lugar de acumularse. Si un worker muere (p. ej. por falta de memoria) el
+pool queda roto: se reemplaza por uno nuevo y sólo falla la consulta afectada.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from backend.audio_indexer import AudioIndexer
+from backend.indexing.registry import IndexRegistry
+
+# Índices abiertos dentro de cada proceso del pool.
+_indexes = None
+
+
+def _elapsed_ms(t0):
+    return round((time.time() - t0) * 1000, 2)
+
+
+def search_audio_file(index_path, audio_path, k):
+    """Corre en un worker: codifica la consulta una vez y aplica ambos KNN."""
+    global _indexes
+    if _indexes is None:
+        _indexes = IndexRegistry(AudioIndexer.from_file)
+    indexer = _indexes.get(index_path)
+
+    t0 = time.time()
+    query_hist = indexer.encode_query(audio_path)
+    t_encode = _elapsed_ms(t0)
+
+    t0 = time.time()
+    knn_seq = indexer.knn_secuencial(query_hist, k=k)
+    t_seq = _elapsed_ms(t0)
+
+    t0 = time.time()
+    knn_inv = indexer.knn_invertido(query_hist, k=k)
+    t_inv = _elapsed_ms(t0)
+
+    return {
+        "knn_secuencial": [{"doc_id": str(d), "score": float(s)} for d, s in knn_seq],
+        "knn_invertido": [{"doc_id": str(d), "score": float(s)} for d, s in knn_inv],
+        "tiempos": {"codificacion": t_encode, "secuencial": t_seq, "invertido": t_inv},
+    }
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+class AudioSearchPool:
+    def __init__(self, index_path, n_workers=2, max_pending=None):
+        self.index_path = index_path
+        self.n_workers = n_workers
+        self.max_pending = max_pending or 2 * n_workers
+        self.pending = 0
+        self._pool = None
+        # Protege el contador y el reemplazo del pool.
+        self._lock = threading.Lock()
+
+    def saturated(self):
+        return self.pending >= self.max_pending
+
+    def acquire(self):
+        """Reserva un lugar en la cola; PoolSaturated si está llena."""
+        with self._lock:
+            if self.saturated():
+                raise PoolSaturated()
+            self.pending += 1
+
+    def release(self):
+        with self._lock:
+            self.pending -= 1
+
+    async def search(self, audio_path, k):
+        """Busca en un worker; BrokenProcessPool si el pool se rompió durante la consulta."""
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.n_workers)
+            pool = self._pool
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(pool, search_audio_file, self.index_path, audio_path, k)
+        except BrokenProcessPool:
+            self._replace_broken(pool)
+            raise
+
+    def _replace_broken(self, pool):
+        with self._lock:
+            # Varias consultas pueden fallar con el mismo pool: sólo la primera
+            # lo reemplaza.
+            if self._pool is pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = ProcessPoolExecutor(max_workers=self.n_workers)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
@@ -0,0 +1,55 @@
+"""
+Cache en disco de descriptores MFCC por canción.
+
+Cada matriz (frames, n_mfcc) se guarda como multimedia/features/<clave>.npy,
+donde la clave es el hash del contenido del audio más los parámetros de
+extracción: renombrar un archivo no invalida su entrada y cambiar n_mfcc o
+hop_length genera otra. Las matrices se abren con mmap, así que construir el
+diccionario y los histogramas no decodifica el audio más de una vez, tampoco
+entre reconstrucciones del índice.
+"""
+import hashlib
+import json
+import os
+import uuid
+import numpy as np
+
+HASH_CHUNK = 1 << 20
+
+
+class FeatureCache:
+    def __init__(self, cache_dir="multimedia/features"):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(path, params):
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+                digest.update(chunk)
+        digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".npy")
+
+    def get(self, path, extract, params):
+        """
+        Descriptores de path; si no están en cache los calcula con
+        extract(path) y los guarda. params debe describir la extracción.
+        """
+        cached = self._path(self.key(path, params))
+        if os.path.exists(cached):
+            self.hits += 1
+            return np.load(cached, mmap_mode="r")
+
+        self.misses += 1
+        features = np.ascontiguousarray(extract(path), dtype=np.float32)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Escritura atómica: otro proceso nunca ve un .npy a medias.
+        tmp_path = os.path.join(self.cache_dir, f"{uuid.uuid4().hex}.tmp.npy")
+        np.save(tmp_path, features)
+        os.replace(tmp_path, cached)
+        return features
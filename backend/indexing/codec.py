@@ -0,0 +1,88 @@
+"""
+Compresión de postings: gaps entre doc ids + Variable Byte.
+
+Cada entero se guarda en grupos de 7 bits, del menos al más significativo;
+el bit alto marca el último byte del entero. Codificación y decodificación
+trabajan sobre arreglos completos con numpy, sin bucles por posting.
+
+Las posiciones (opcionales) de un término se guardan igual: por cada
+documento de su lista, en el mismo orden, sus TF posiciones como gaps.
+"""
+import numpy as np
+
+_MAX_BYTES = 5  # suficiente para enteros de 32 bits
+
+
+def vbyte_encode(values):
+    values = np.asarray(values, dtype=np.uint64)
+    if len(values) == 0:
+        return b""
+    nbytes = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 7 * _MAX_BYTES, 7):
+        nbytes += values >= (1 << shift)
+
+    ends = np.cumsum(nbytes)
+    starts = ends - nbytes
+    out = np.empty(int(ends[-1]), dtype=np.uint8)
+    for b in range(int(nbytes.max())):
+        mask = nbytes > b
+        out[starts[mask] + b] = (values[mask] >> np.uint64(7 * b)) & np.uint64(0x7F)
+    out[ends - 1] |= 0x80
+    return out.tobytes()
+
+
+def vbyte_decode(data):
+    """Decodifica todos los enteros de un buffer (bytes o arreglo uint8)."""
+    data = np.frombuffer(data, dtype=np.uint8) if not isinstance(data, np.ndarray) else data
+    if len(data) == 0:
+        return np.empty(0, dtype=np.int64)
+    ends = np.flatnonzero(data & 0x80)
+    if len(ends) == len(data):
+        # Caso frecuente: todos los enteros caben en un byte.
+        return (data & 0x7F).astype(np.int64)
+    starts = np.empty(len(ends), dtype=np.int64)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+
+    # Posición de cada byte dentro de su entero, para desplazarlo 7 * pos bits.
+    group = np.zeros(len(data), dtype=np.int64)
+    group[ends[:-1] + 1] = 1
+    group = np.cumsum(group)
+    pos = np.arange(len(data), dtype=np.int64) - starts[group]
+
+    parts = (data & 0x7F).astype(np.int64) << (7 * pos)
+    return np.add.reduceat(parts, starts)
+
+
+def encode_postings(docs, tfs):
+    """Doc ids crecientes como gaps y TF, ambos en VByte, uno tras otro."""
+    docs = np.asarray(docs, dtype=np.int64)
+    gaps = np.diff(docs, prepend=0)
+    return vbyte_encode(gaps) + vbyte_encode(tfs)
+
+
+def decode_postings(data, df):
+    values = vbyte_decode(data)
+    docs = np.cumsum(values[:df]).astype(np.int32)
+    tfs = values[df:2 * df].astype(np.int32)
+    return docs, tfs
+
+
+def encode_positions(positions, tfs):
+    """positions: posiciones de todos los documentos concatenadas (crecientes dentro de cada uno)."""
+    positions = np.asarray(positions, dtype=np.int64)
+    gaps = np.diff(positions, prepend=0)
+    # La primera posición de cada documento va completa, no como gap.
+    starts = np.cumsum(tfs) - tfs
+    gaps[starts] = positions[starts]
+    return vbyte_encode(gaps)
+
+
+def decode_positions(data, tfs):
+    """Posiciones concatenadas; las del documento j empiezan en cumsum(tfs)[j] - tfs[j]."""
+    values = vbyte_decode(data)
+    if len(values) == 0:
+        return values
+    total = np.cumsum(values)
+    starts = np.cumsum(tfs) - tfs
+    return total - np.repeat(total[starts] - values[starts], tfs)
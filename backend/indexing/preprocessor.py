@@ -1,15 +1,57 @@
+import os
 import re
-import nltk
-from nltk.corpus import stopwords
+from functools import lru_cache
 from nltk.stem import PorterStemmer
 
-nltk.download('stopwords')
-stop_words = set(stopwords.words('english'))
+# Lista de stopwords en inglés de NLTK, incluida en el repo para no depender
+# de nltk.download (lento al arrancar y falla sin red).
+STOPWORDS_PATH = os.path.join(os.path.dirname(__file__), "stopwords_english.txt")
+STEM_CACHE_SIZE = 200_000
+# Con posiciones las stopwords también se devuelven, con este prefijo, para
+# verificar frases. Ningún token normal lo tiene: tokenize quita la puntuación.
+STOPWORD_PREFIX = "#"
+
+_punctuation = re.compile(r"[^\w\s]")
 stemmer = PorterStemmer()
 
+
+@lru_cache(maxsize=1)
+def get_stop_words():
+    with open(STOPWORDS_PATH, "r", encoding="utf-8") as f:
+        return frozenset(line.strip() for line in f if line.strip())
+
+
+# Las letras repiten mucho vocabulario: cada palabra se stemmiza una sola vez.
+stem = lru_cache(maxsize=STEM_CACHE_SIZE)(stemmer.stem)
+
+
+def tokenize(text):
+    return _punctuation.sub("", text.lower()).split()
+
+
+def preprocess_batch(texts, positions=False):
+    """
+    Preprocesa varios textos juntos: el stemming se hace una vez por palabra
+    distinta del lote y no por cada aparición. Con positions=True cada token
+    viene como (token, posición de la palabra en el texto) y las stopwords
+    también aparecen, sin stemming y con STOPWORD_PREFIX, para que las frases
+    se puedan verificar palabra por palabra.
+    """
+    stop_words = get_stop_words()
+    token_lists = [tokenize(text) for text in texts]
+    vocabulary = {w for tokens in token_lists for w in tokens}
+    stems = {w: stem(w) for w in vocabulary if w not in stop_words}
+    if positions:
+        return [
+            [(stems[w] if w in stems else STOPWORD_PREFIX + w, p) for p, w in enumerate(tokens)]
+            for tokens in token_lists
+        ]
+    return [[stems[w] for w in tokens if w in stems] for tokens in token_lists]
+
+
+def is_stopword_term(term):
+    return term.startswith(STOPWORD_PREFIX)
+
+
 def preprocess(text):
-    
-    text = re.sub(r'[^\w\s]', '', text.lower())
-    tokens = text.split()
-    tokens = [stemmer.stem(w) for w in tokens if w not in stop_words]
-    return tokens
+    return preprocess_batch([text])[0]
@@ -0,0 +1,121 @@
+"""
+Plan booleano de una consulta ya preprocesada.
+
+parse_sql_query devuelve el WHERE como árbol de ("like", columna, patrón),
+("and", hijos) y ("or", hijos). Acá cada patrón se preprocesa y queda como
+("terms", columna, tokens); dentro de una hoja los términos se combinan como
+OR (igual que una consulta rankeada normal). Las hojas sin tokens (sólo
+stopwords) no filtran nada y se eliminan. Las comparaciones sobre la metadata
+("cmp", op, columna, valor) quedan tal cual. Los planes son tuplas, así que
+sirven como clave de cache.
+
+Un patrón entre comillas dobles es una frase: LIKE '"always love you"' sólo
+acepta documentos con esas palabras seguidas, y LIKE '"love baby"~5'
+documentos donde cada término aparece a lo sumo a 5 palabras del primero, en
+cualquier orden. Quedan como ("phrase", columna, tokens, distancias al primer
+token, slop, stopwords), con slop None para la frase exacta. Las stopwords no
+rankean; en una frase exacta se verifican como (término, distancia) en los
+índices que las guardan (ver preprocessor.STOPWORD_PREFIX) y en los
+anteriores ocupan su lugar pero aceptan cualquier palabra. Una frase hecha
+sólo de stopwords no filtra nada, igual que cualquier patrón sin tokens.
+"""
+import re
+from backend.indexing.preprocessor import is_stopword_term, preprocess_batch
+
+_phrase = re.compile(r'^\s*"(.*)"\s*(?:~\s*(\d+))?\s*$', re.S)
+
+
+def _parse_pattern(pattern):
+    """(texto, es frase, slop)."""
+    match = _phrase.match(pattern)
+    if match is None:
+        return pattern, False, None
+    slop = match.group(2)
+    return match.group(1), True, int(slop) if slop is not None else None
+
+
+def _patterns(plan, out):
+    if plan is None:
+        return
+    if plan[0] == "like":
+        out.append(_parse_pattern(plan[2])[0])
+    elif plan[0] != "cmp":
+        for child in plan[1]:
+            _patterns(child, out)
+
+
+def _build(plan, tokens):
+    if plan is None:
+        return None
+    if plan[0] == "like":
+        leaf_tokens = next(tokens)
+        content = [(t, p) for t, p in leaf_tokens if not is_stopword_term(t)]
+        if not content:
+            return None
+        _, phrase, slop = _parse_pattern(plan[2])
+        first = content[0][1]
+        stops = tuple((t, p - first) for t, p in leaf_tokens if is_stopword_term(t)) if slop is None else ()
+        if phrase and (len(content) > 1 or stops):
+            return ("phrase", plan[1], tuple(t for t, _ in content),
+                    tuple(p - first for _, p in content), slop, stops)
+        return ("terms", plan[1], tuple(t for t, _ in content))
+    if plan[0] == "cmp":
+        return plan
+    op = plan[0]
+    children = []
+    for child in plan[1]:
+        child = _build(child, tokens)
+        if child is None:
+            continue
+        # (a AND b) AND c -> AND(a, b, c)
+        children.extend(child[1] if child[0] == op else [child])
+    if not children:
+        return None
+    return children[0] if len(children) == 1 else (op, tuple(children))
+
+
+def tokenize_plans(plans):
+    """Preprocesa los patrones de todos los planes en un solo lote."""
+    patterns = []
+    for plan in plans:
+        _patterns(plan, patterns)
+    tokens = iter(preprocess_batch(patterns, positions=True))
+    return [_build(plan, tokens) for plan in plans]
+
+
+def tokenize_plan(plan):
+    return tokenize_plans([plan])[0]
+
+
+def plan_tokens(plan):
+    """Todos los tokens del plan; son los que se usan para rankear."""
+    if plan is None or plan[0] == "cmp":
+        return []
+    if plan[0] in ("terms", "phrase"):
+        return list(plan[2])
+    return [token for child in plan[1] for token in plan_tokens(child)]
+
+
+def is_conjunctive(plan):
+    """True si el plan tiene algún AND o frase, es decir, si filtra candidatos."""
+    if plan is None or plan[0] in ("terms", "cmp"):
+        return False
+    if plan[0] == "phrase":
+        return True
+    return plan[0] == "and" or any(is_conjunctive(child) for child in plan[1])
+
+
+def plan_columns(plan):
+    """Columnas de las hojas de texto del plan (None si el LIKE no nombra una)."""
+    if plan is None or plan[0] == "cmp":
+        return set()
+    if plan[0] in ("terms", "phrase"):
+        return {plan[1]}
+    return set().union(*(plan_columns(child) for child in plan[1]))
+
+
+def has_metadata(plan):
+    """True si el plan tiene comparaciones sobre la metadata."""
+    if plan is None or plan[0] in ("terms", "phrase"):
+        return False
+    return plan[0] == "cmp" or any(has_metadata(child) for child in plan[1])
@@ -0,0 +1,75 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class IndexRegistry:
+    """
+    Cache de índices abiertos compartido por todo el proceso.
+
+    Cada entrada se identifica por la ruta del archivo y recuerda la versión
+    (inode, mtime, tamaño) con la que se abrió; si el archivo cambia, por
+    ejemplo tras reconstruirlo en /insert_csv, se vuelve a abrir. Cuando la
+    memoria estimada supera max_bytes se descartan las entradas menos usadas.
+    """
+
+    def __init__(self, loader, max_bytes=512 * 1024 * 1024):
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _version(path):
+        stat = os.stat(path)
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    @staticmethod
+    def _footprint(value, path):
+        footprint = getattr(value, "memory_footprint", None)
+        if callable(footprint):
+            return footprint()
+        return os.path.getsize(path)
+
+    def get(self, path):
+        version = self._version(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(path)
+                return entry[2]
+
+        value = self.loader(path)
+        size = self._footprint(value, path)
+
+        with self._lock:
+            self._discard(path)
+            self._entries[path] = (version, size, value)
+            self._total_bytes += size
+            # Siempre se conserva al menos la entrada recién abierta.
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+        return value
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self._total_bytes = 0
+            else:
+                self._discard(path)
+
+    def _discard(self, path):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._total_bytes -= entry[1]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,83 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    Cache LRU con TTL de resultados de consultas.
+
+    La clave incluye la versión del índice (ver IndexRegistry._version), así
+    que una tabla reconstruida o con filas nuevas nunca devuelve resultados
+    viejos; invalidate(table) además libera de inmediato sus entradas. El
+    tamaño de cada entrada se estima por su JSON y el total se mantiene bajo
+    max_bytes descartando las menos usadas.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=300):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(table, version, tokens, k, fields=None, plan=None):
+        # Tokens ordenados: el orden de las palabras no cambia el resultado.
+        # plan (una tupla, ver query_plan.py) distingue consultas booleanas.
+        return (table, version, tuple(sorted(tokens)), k, tuple(fields) if fields is not None else None, plan)
+
+    def get(self, key):
+        """Resultado guardado o None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    self._discard(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, value):
+        size = len(json.dumps(value, default=str)) + 200
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate(self, table=None):
+        with self._lock:
+            if table is None:
+                self._entries.clear()
+                self._total_bytes = 0
+                return
+            for key in [key for key in self._entries if key[0] == table]:
+                self._discard(key)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[1]
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
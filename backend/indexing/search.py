@@ -1,35 +1,451 @@
+import bisect
+import heapq
 import json
 import math
+import os
+import time
 from collections import Counter
-from backend.indexing.preprocessor import preprocess
+import numpy as np
+from backend.indexing.preprocessor import preprocess_batch
+from backend.indexing.query_plan import is_conjunctive, plan_tokens
+from backend.indexing.segment import SegmentReader
+from backend.metrics import add_time
+
+# Con candidates * log2(postings) > DENSE_LOOKUP * postings, buscar los
+# candidatos por bisección cuesta más que indexar un arreglo denso.
+DENSE_LOOKUP = 4
+
+
+def _lookup(docs, cand_docs):
+    """
+    (idx, hit): hit indica qué candidatos están en docs (ordenada) y idx[hit]
+    su posición. Pocos candidatos se buscan por bisección (O(m log n)); si
+    son muchos frente a la lista se usa un arreglo indexado por doc id (O(n)).
+    """
+    if len(cand_docs) and len(cand_docs) * math.log2(len(docs) + 1) > DENSE_LOOKUP * len(docs):
+        pos = np.full(int(max(docs[-1], cand_docs[-1])) + 1, -1, dtype=np.int64)
+        pos[docs] = np.arange(len(docs))
+        idx = pos[cand_docs]
+        return idx, idx >= 0
+    idx = np.minimum(np.searchsorted(docs, cand_docs), len(docs) - 1)
+    return idx, docs[idx] == cand_docs
+
 
 class SPIMISearcher:
-    def __init__(self, index_path="data/Audio/index.json"):
-        with open(index_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            self.index = data["index"]
-            self.doc_norms = data["doc_norms"]
+    def __init__(self, index_path="data/Audio/index.bin"):
+        """
+        index_path puede ser un segmento suelto (.bin) o el manifest.json de
+        una tabla con varios segmentos (ver table_index.py).
+        """
+        # Abrir el índice sólo mapea los archivos; los postings se leen al consultar.
+        if index_path.endswith(".json"):
+            with open(index_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            index_dir = os.path.dirname(index_path)
+            self.segments = [
+                (seg["base"], SegmentReader(os.path.join(index_dir, seg["name"])))
+                for seg in manifest["segments"]
+            ]
+        else:
+            self.segments = [(0, SegmentReader(index_path))]
+        self.bases = [base for base, _ in self.segments]
+        self.n_docs = sum(segment.n_docs for _, segment in self.segments)
 
-    def search(self, query, top_k=5):
-        query_tokens = preprocess(query)
-        tf_query = Counter(query_tokens)
-        scores = {}
-        query_norm = 0
+    def memory_footprint(self):
+        # Cota superior: todas las páginas de los segmentos residentes en memoria.
+        return sum(segment.size for _, segment in self.segments)
+
+    def doc_id(self, doc):
+        """doc_id externo de un doc id global."""
+        k = bisect.bisect_right(self.bases, doc) - 1
+        base, segment = self.segments[k]
+        return segment.doc_id(doc - base)
+
+    def _term_info(self, term):
+        """(posición del término en cada segmento, DF global)."""
+        entries = [segment.find(term) for _, segment in self.segments]
+        df = sum(segment.df_at(i) for (_, segment), i in zip(self.segments, entries))
+        return entries, df
 
-        for term, tf in tf_query.items():
-            postings = self.index.get(term, [])
-            idf = math.log(len(self.doc_norms) / (1 + len(postings)))
+    def _query_terms(self, tokens, term_info=None):
+        """
+        Pesos de la consulta con IDF global: el DF de cada término es la suma
+        de su DF en todos los segmentos. term_info permite compartir las
+        búsquedas en el diccionario entre varias consultas.
+        """
+        terms = []
+        query_norm = 0
+        if self.n_docs == 0:
+            return terms, query_norm
+        for term, tf in Counter(tokens).items():
+            if term_info is None:
+                entries, df = self._term_info(term)
+            else:
+                if term not in term_info:
+                    term_info[term] = self._term_info(term)
+                entries, df = term_info[term]
+            idf = math.log(self.n_docs / (1 + df))
             wq = tf * idf
             query_norm += wq ** 2
+            if df and wq != 0:
+                terms.append((entries, idf, wq))
+        return terms, math.sqrt(query_norm)
+
+    def search(self, query, top_k=5):
+        return [(self.doc_id(doc), score) for doc, score in self.search_docs(query, top_k)]
+
+    def search_docs(self, query, top_k=5):
+        """
+        Coseno TF-IDF con poda MaxScore en cada segmento; devuelve
+        (doc id global, score). Los segmentos se recorren en orden y el
+        k-ésimo mejor puntaje acumulado sirve de piso para podar los siguientes.
+        """
+        tokens = preprocess_batch([query])[0]
+        return self.search_tokens(tokens, top_k)
+
+    def search_many(self, queries, top_k=5):
+        """
+        Varias consultas sobre el mismo índice. Se tokenizan juntas y cada
+        término se busca en el diccionario y se decodifica una sola vez para
+        todo el lote. Devuelve una lista de resultados de search_docs.
+        """
+        term_info = {}
+        postings = [{} for _ in self.segments]
+        return [
+            self.search_tokens(tokens, top_k, term_info, postings)
+            for tokens in preprocess_batch(queries)
+        ]
+
+    def search_tokens(self, tokens, top_k, term_info=None, postings=None, timings=None):
+        """
+        search_docs sobre una consulta ya preprocesada. Si se pasa timings
+        (dict), se le suman los segundos de cada etapa: "postings" (diccionario
+        y decodificación), "scoring" y "topk".
+        """
+        if top_k <= 0:
+            return []
+        t0 = time.perf_counter()
+        terms, query_norm = self._query_terms(tokens, term_info)
+        add_time(timings, "postings", time.perf_counter() - t0)
+        if not terms or query_norm == 0:
+            return []
+
+        best = []
+        for k, (base, segment) in enumerate(self.segments):
+            floor = best[0][0] if len(best) >= top_k else -math.inf
+            seg_terms = [(entries[k], idf, wq) for entries, idf, wq in terms if entries[k] >= 0]
+            cache = postings[k] if postings is not None else None
+            hits = self._search_segment(segment, seg_terms, query_norm, top_k, floor, cache, timings)
+            t0 = time.perf_counter()
+            self._merge_hits(best, hits, base, top_k)
+            add_time(timings, "topk", time.perf_counter() - t0)
+
+        return self._ranked(best)
+
+    def search_plan(self, plan, top_k, term_info=None, postings=None, timings=None):
+        """
+        Consulta booleana (ver query_plan.py): primero se calculan los
+        candidatos que cumplen el plan y el coseno con todos los tokens se
+        calcula sólo sobre ellos. Sin ANDs el plan es la unión de sus
+        términos y se resuelve con search_tokens (MaxScore).
+        """
+        tokens = plan_tokens(plan)
+        if not is_conjunctive(plan):
+            return self.search_tokens(tokens, top_k, term_info, postings, timings)
+        if top_k <= 0:
+            return []
+
+        t0 = time.perf_counter()
+        if term_info is None:
+            term_info = {}
+        terms, query_norm = self._query_terms(tokens, term_info)
+        add_time(timings, "postings", time.perf_counter() - t0)
+        if query_norm == 0:
+            return []
+
+        best = []
+        for k, (base, segment) in enumerate(self.segments):
+            cache = postings[k] if postings is not None else {}
+            cand_docs = self._plan_candidates(plan, k, segment, term_info, cache, timings)
+            if len(cand_docs) == 0:
+                continue
+            floor = best[0][0] if len(best) >= top_k else -math.inf
+            seg_terms = [(entries[k], idf, wq) for entries, idf, wq in terms if entries[k] >= 0]
+            hits = self._search_segment(segment, seg_terms, query_norm, top_k, floor, cache, timings, cand_docs)
+            t0 = time.perf_counter()
+            self._merge_hits(best, hits, base, top_k)
+            add_time(timings, "topk", time.perf_counter() - t0)
+
+        return self._ranked(best)
+
+    def candidate_docs(self, plan, term_info=None, postings=None, timings=None):
+        """Doc ids globales (ordenados) que cumplen un plan sólo de texto."""
+        if term_info is None:
+            term_info = {}
+        for term in set(plan_tokens(plan)):
+            if term not in term_info:
+                term_info[term] = self._term_info(term)
+        found = []
+        for k, (base, segment) in enumerate(self.segments):
+            cache = postings[k] if postings is not None else {}
+            docs = self._plan_candidates(plan, k, segment, term_info, cache, timings)
+            found.append(np.asarray(docs, dtype=np.int64) + base)
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+    def score_docs(self, tokens, docs, term_info=None, postings=None, timings=None):
+        """Coseno TF-IDF exacto de la consulta para los doc ids globales docs (ordenados)."""
+        scores = np.zeros(len(docs), dtype=np.float64)
+        terms, query_norm = self._query_terms(tokens, term_info)
+        if not terms or query_norm == 0 or len(docs) == 0:
+            return scores
+        for k, (base, segment) in enumerate(self.segments):
+            lo, hi = np.searchsorted(docs, [base, base + segment.n_docs])
+            if lo == hi:
+                continue
+            local = docs[lo:hi] - base
+            cache = postings[k] if postings is not None else {}
+            norms = np.maximum(segment.norms[local], 1e-6)
+            for entries, idf, wq in terms:
+                if entries[k] < 0:
+                    continue
+                seg_docs, tfs = self._postings(segment, entries[k], cache, timings)
+                t0 = time.perf_counter()
+                idx, hit = _lookup(seg_docs, local)
+                scores[lo:hi][hit] += tfs[idx[hit]] * (idf * wq / query_norm) / norms[hit]
+                add_time(timings, "scoring", time.perf_counter() - t0)
+        return scores
+
+    @staticmethod
+    def _merge_hits(best, hits, base, top_k):
+        """
+        Agrega los (puntaje, doc) de un segmento al heap global acotado a
+        top_k. Guarda (puntaje, -doc global): a igual puntaje gana el doc id menor.
+        """
+        for score, doc in hits:
+            item = (score, -(base + doc))
+            if len(best) < top_k:
+                heapq.heappush(best, item)
+            elif item > best[0]:
+                heapq.heapreplace(best, item)
+
+    @staticmethod
+    def _ranked(best):
+        """[(doc, puntaje)] del heap de _merge_hits, de mayor a menor puntaje."""
+        best.sort(reverse=True)
+        return [(-neg_doc, score) for score, neg_doc in best]
+
+    @staticmethod
+    def _postings(segment, i, cache, timings):
+        t0 = time.perf_counter()
+        if i not in cache:
+            cache[i] = segment.postings_at(i)
+        add_time(timings, "postings", time.perf_counter() - t0)
+        return cache[i]
+
+    def _plan_size(self, plan, k, segment, term_info):
+        """Cota del número de candidatos del plan en el segmento k, sin decodificar."""
+        if plan[0] == "terms":
+            return sum(segment.df_at(term_info[t][0][k]) for t in set(plan[2]))
+        if plan[0] == "phrase":
+            return min(segment.df_at(term_info[t][0][k]) for t in set(plan[2]))
+        sizes = [self._plan_size(child, k, segment, term_info) for child in plan[1]]
+        return min(sizes) if plan[0] == "and" else sum(sizes)
+
+    def _plan_candidates(self, plan, k, segment, term_info, cache, timings):
+        """Doc ids locales (ordenados) del segmento k que cumplen el plan."""
+        if plan[0] == "terms":
+            lists = [
+                self._postings(segment, term_info[t][0][k], cache, timings)[0]
+                for t in set(plan[2]) if term_info[t][0][k] >= 0
+            ]
+            if not lists:
+                return np.empty(0, dtype=np.int64)
+            return lists[0] if len(lists) == 1 else np.unique(np.concatenate(lists))
+
+        if plan[0] == "phrase":
+            # Primero el filtro conjuntivo; las posiciones se leen sólo para
+            # los documentos que tienen todos los términos. Sin posiciones en
+            # el segmento la frase queda como un AND de sus términos.
+            terms = tuple(("terms", None, (t,)) for t in dict.fromkeys(plan[2]))
+            docs = self._plan_candidates(("and", terms), k, segment, term_info, cache, timings)
+            if len(docs) == 0 or not segment.has_positions:
+                return docs
+            t0 = time.perf_counter()
+            docs = self._match_positions(plan, k, segment, term_info, cache, docs, timings)
+            add_time(timings, "positions", time.perf_counter() - t0)
+            return docs
+
+        children = plan[1]
+        if plan[0] == "or":
+            lists = [self._plan_candidates(c, k, segment, term_info, cache, timings) for c in children]
+            return np.unique(np.concatenate(lists))
+
+        # AND: se parte de la lista más corta (estimada con el DF, antes de
+        # decodificar) y cada hijo siguiente sólo se busca en los candidatos
+        # que quedan. Una lista vacía corta el resto sin decodificar nada.
+        children = sorted(children, key=lambda c: self._plan_size(c, k, segment, term_info))
+        result = None
+        for child in children:
+            if self._plan_size(child, k, segment, term_info) == 0:
+                return np.empty(0, dtype=np.int64)
+            docs = self._plan_candidates(child, k, segment, term_info, cache, timings)
+            t0 = time.perf_counter()
+            result = docs if result is None else self._intersect(result, docs)
+            add_time(timings, "filter", time.perf_counter() - t0)
+            if len(result) == 0:
+                break
+        return result
+
+    def _position_keys(self, segment, i, cand_docs, cache, timings):
+        """
+        Apariciones del término i en los candidatos como claves
+        (índice del candidato << 32) | posición, en orden creciente.
+        """
+        docs, tfs = self._postings(segment, i, cache, timings)
+        if ("positions", i) not in cache:
+            cache[("positions", i)] = (segment.positions_at(i, tfs), np.cumsum(tfs) - tfs)
+        positions, starts = cache[("positions", i)]
+        idx, hit = _lookup(docs, cand_docs)
+        # Las stopwords no pasan por el filtro conjuntivo: puede faltar en algún candidato.
+        counts = np.where(hit, tfs[idx], 0).astype(np.int64)
+        ends = np.cumsum(counts)
+        within = np.arange(ends[-1]) - np.repeat(ends - counts, counts)
+        ranks = np.repeat(np.arange(len(cand_docs), dtype=np.int64), counts)
+        return (ranks << 32) | positions[np.repeat(starts[idx], counts) + within]
+
+    def _match_positions(self, plan, k, segment, term_info, cache, cand_docs, timings):
+        """
+        Candidatos (que ya tienen todos los términos) donde la frase aparece:
+        cada aparición del primer término es un ancla, y cada término
+        siguiente debe estar justo a su distancia en la frase (o, con slop, a
+        lo sumo a slop palabras del ancla). Si el segmento guarda stopwords,
+        las de una frase exacta se verifican igual, al final porque sus listas
+        son las más largas. Todo con búsquedas binarias sobre las claves de
+        _position_keys, sin leer los documentos.
+        """
+        _, _, tokens, offsets, slop, stops = plan
+        entries = [term_info[t][0][k] for t in tokens]
+        checks = [(i, offset, slop) for i, offset in zip(entries[1:], offsets[1:])]
+        if segment.has_stopwords:
+            for term, offset in stops:
+                if term not in term_info:
+                    term_info[term] = self._term_info(term)
+                checks.append((term_info[term][0][k], offset, None))
+        anchors = self._position_keys(segment, entries[0], cand_docs, cache, timings)
+        for i, offset, slop in checks:
+            if i < 0:
+                return cand_docs[:0]
+            keys = self._position_keys(segment, i, cand_docs, cache, timings)
+            if len(keys) == 0:
+                return cand_docs[:0]
+            if slop is None:
+                lo = hi = anchors + offset
+            else:
+                ranks, pos = anchors >> 32, anchors & 0xFFFFFFFF
+                lo = (ranks << 32) | np.maximum(pos - slop, 0)
+                hi = anchors + slop
+            ix = np.searchsorted(keys, lo)
+            if slop is not None and i == entries[0]:
+                # El mismo término que el ancla: tiene que ser otra aparición.
+                ix += keys[np.minimum(ix, len(keys) - 1)] == anchors
+            found = keys[np.minimum(ix, len(keys) - 1)]
+            anchors = anchors[(ix < len(keys)) & (found >= lo) & (found <= hi)]
+            if len(anchors) == 0:
+                break
+        return cand_docs[np.unique(anchors >> 32)]
+
+    @staticmethod
+    def _intersect(a, b):
+        """Intersección de dos listas ordenadas, buscando la más corta en la más larga."""
+        if len(a) > len(b):
+            a, b = b, a
+        if len(a) == 0:
+            return a
+        return a[_lookup(b, a)[1]]
+
+    @staticmethod
+    def _search_segment(segment, terms, query_norm, top_k, floor, cache=None, timings=None, candidates=None):
+        """
+        Term-at-a-time con poda MaxScore dentro de un segmento.
+
+        Los términos se procesan de mayor a menor cota superior. Cuando la
+        suma de las cotas de los términos que faltan queda por debajo del
+        umbral (el k-ésimo mejor puntaje parcial, o el piso que viene de
+        otros segmentos), ningún documento nuevo puede entrar al top-k: desde
+        ahí sólo se actualizan los candidatos existentes buscando sus doc ids
+        en los postings restantes (sin recorrerlos completos) y se descartan
+        los que ya no alcanzan el umbral. cache guarda los postings ya
+        decodificados (por posición del término) entre consultas de un lote.
+        timings acumula el tiempo de cada etapa (ver search_tokens).
+        Con candidates (doc ids locales ordenados, ver search_plan) sólo se
+        rankean esos documentos: se arranca directamente en la segunda fase.
+        """
+        if not terms or top_k <= 0:
+            return []
+        norms = segment.norms
+
+        # El margen cubre el redondeo de las cotas guardadas en float32.
+        bounds = [
+            segment.max_tf_norm_at(i) * abs(idf * wq) / query_norm * (1 + 1e-5)
+            for i, idf, wq in terms
+        ]
+        if sum(bounds) < floor:
+            # Ni sumando todos los términos se alcanza el piso.
+            return []
+        order = sorted(range(len(terms)), key=lambda j: bounds[j], reverse=True)
+
+        if candidates is None:
+            cand_docs = np.empty(0, dtype=np.int64)
+            cand_scores = np.empty(0, dtype=np.float64)
+            admitting = True
+        else:
+            cand_docs = candidates
+            cand_scores = np.zeros(len(candidates), dtype=np.float64)
+            admitting = False
+        t_postings = t_scoring = 0.0
 
-            for doc_id, w in postings:
-                doc_id = str(doc_id)
-                scores[doc_id] = scores.get(doc_id, 0) + w * wq
+        for pos, j in enumerate(order):
+            i, idf, wq = terms[j]
+            remaining = sum(bounds[r] for r in order[pos + 1:])
+            t0 = time.perf_counter()
+            if cache is None:
+                docs, tfs = segment.postings_at(i)
+            else:
+                if i not in cache:
+                    cache[i] = segment.postings_at(i)
+                docs, tfs = cache[i]
+            t1 = time.perf_counter()
+            t_postings += t1 - t0
+            scale = idf * wq / query_norm
 
-        query_norm = math.sqrt(query_norm)
+            if admitting:
+                # Unión: los documentos nuevos todavía pueden llegar al top-k.
+                contrib = tfs * scale / np.maximum(norms[docs], 1e-6)
+                all_docs = np.concatenate([cand_docs, docs])
+                cand_docs, inverse = np.unique(all_docs, return_inverse=True)
+                cand_scores = np.bincount(
+                    inverse, weights=np.concatenate([cand_scores, contrib]), minlength=len(cand_docs)
+                )
+            else:
+                # Sólo se buscan los candidatos vivos dentro de los postings.
+                idx, hit = _lookup(docs, cand_docs)
+                hit_docs = cand_docs[hit]
+                cand_scores[hit] += tfs[idx[hit]] * scale / np.maximum(norms[hit_docs], 1e-6)
 
-        for doc_id in scores:
-            doc_norm = self.doc_norms.get(str(doc_id), 1e-6)
-            scores[doc_id] /= (query_norm * doc_norm)
+            threshold = floor
+            if len(cand_scores) >= top_k:
+                threshold = max(threshold, np.partition(cand_scores, -top_k)[-top_k])
+            if admitting and remaining < threshold:
+                admitting = False
+            if not admitting:
+                alive = cand_scores + remaining >= threshold
+                cand_docs, cand_scores = cand_docs[alive], cand_scores[alive]
+            t_scoring += time.perf_counter() - t1
 
-        return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+        t0 = time.perf_counter()
+        best = heapq.nlargest(top_k, zip(cand_scores.tolist(), cand_docs.tolist()),
+                              key=lambda item: (item[0], -item[1]))
+        add_time(timings, "postings", t_postings)
+        add_time(timings, "scoring", t_scoring)
+        add_time(timings, "topk", time.perf_counter() - t0)
+        return best
@@ -0,0 +1,265 @@
+"""
+Formato binario de un segmento del índice invertido.
+
+Todos los enteros son little-endian. El archivo se abre con mmap y sólo se
+leen las páginas de los términos consultados.
+
+    header    magic "SPIX", version u16, flags u16, n_docs u32, n_terms u32,
+              y los offsets (u64) de cada sección
+    docs      u32[n_docs + 1] offsets + blob utf-8 con los doc_id externos
+    norms     f32[n_docs] norma TF-IDF de cada documento
+    terms     u32[n_terms + 1] offsets + blob utf-8 con los términos ordenados
+    dict      por término: offset u64 (relativo a postings), largo u32 en
+              bytes, df u32 y max_tf_norm f32 = max TF / norma del documento;
+              por el IDF del término es la cota superior de su aporte al
+              coseno usada para podar (MaxScore)
+    postings  por término: gaps de doc ids y TF comprimidos con VByte
+              (ver codec.py)
+    positions opcional (flag FLAG_POSITIONS): u64[n_terms + 1] offsets + blob
+              con las posiciones de cada término en VByte; el offset de la
+              sección va en los últimos 8 bytes del archivo. Los segmentos
+              sin posiciones no cambian. Con FLAG_STOPWORDS el diccionario
+              incluye además las stopwords (con STOPWORD_PREFIX, ver
+              preprocessor.py) sólo para verificar frases; no entran en las
+              normas.
+
+Los doc ids internos son densos (0..n_docs-1) y crecientes dentro de cada
+lista de postings. Si el segmento es parte de una tabla con varios segmentos
+(ver table_index.py) las normas se calculan con el DF global de la tabla al
+momento de escribirlo. El peso TF-IDF no se guarda: es TF * IDF, y el IDF sale
+del DF del diccionario, así que guardar el TF entero no pierde precisión.
+"""
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import numpy as np
+from backend.indexing.codec import encode_postings, decode_postings, encode_positions, decode_positions
+
+MAGIC = b"SPIX"
+VERSION = 3
+HEADER = struct.Struct("<4sHHIIQQQQQ")
+DICT_ENTRY = np.dtype([("offset", "<u8"), ("length", "<u4"), ("df", "<u4"), ("max_tf_norm", "<f4")])
+FLAG_POSITIONS = 1
+FLAG_STOPWORDS = 2
+FOOTER = struct.Struct("<Q")
+
+
+def segment_version(path):
+    """Versión del formato de un segmento en disco (None si no es un segmento)."""
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size or header[:4] != MAGIC:
+        return None
+    return HEADER.unpack(header)[1]
+
+
+def _pad(f):
+    # Alinea cada sección a 8 bytes para que numpy lea vistas alineadas.
+    pos = f.tell()
+    if pos % 8:
+        f.write(b"\0" * (8 - pos % 8))
+    return f.tell()
+
+
+def _write_strings(f, strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype="<u4")
+    if encoded:
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+    f.write(offsets.tobytes())
+    f.write(b"".join(encoded))
+
+
+class SegmentWriter:
+    """
+    Escribe un segmento. Los términos deben llegar en orden; los postings se
+    van volcando a un archivo temporal y al cerrar se arma el archivo final.
+    Con positions=True cada término lleva también sus posiciones;
+    stopwords=True marca que las stopwords están en el diccionario.
+    """
+
+    def __init__(self, path, doc_ids, positions=False, stopwords=False):
+        self.path = path
+        self.doc_ids = [str(d) for d in doc_ids]
+        self.norms = np.zeros(len(self.doc_ids), dtype="<f4")
+        self.terms = []
+        self.entries = []
+        out_dir = os.path.dirname(path) or "."
+        os.makedirs(out_dir, exist_ok=True)
+        self._postings = tempfile.TemporaryFile(dir=out_dir)
+        self._positions = tempfile.TemporaryFile(dir=out_dir) if positions else None
+        self._position_offsets = [0]
+        self._stopwords = stopwords
+
+    def add_term(self, term, docs, tfs, positions=None):
+        if self.terms and term <= self.terms[-1]:
+            raise ValueError(f"Términos fuera de orden: '{term}' después de '{self.terms[-1]}'")
+        data = encode_postings(docs, tfs)
+        self.terms.append(term)
+        self.entries.append((self._postings.tell(), len(data), len(docs), 0.0))
+        self._postings.write(data)
+        if self._positions is not None:
+            self._positions.write(encode_positions(positions, tfs))
+            self._position_offsets.append(self._positions.tell())
+
+    def set_norms(self, norms):
+        self.norms = np.asarray(norms, dtype="<f4")
+
+    def _compute_max_scores(self):
+        # Las normas sólo se conocen al final, así que las cotas se calculan
+        # releyendo secuencialmente los postings ya escritos.
+        norms = np.where(self.norms > 0, self.norms, 1e-6)
+        self._postings.seek(0)
+        for i, (offset, length, df, _) in enumerate(self.entries):
+            docs, tfs = decode_postings(self._postings.read(length), df)
+            self.entries[i] = (offset, length, df, float(np.max(tfs / norms[docs])))
+
+    def close(self):
+        self._compute_max_scores()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"\0" * HEADER.size)
+            docs_off = _pad(f)
+            _write_strings(f, self.doc_ids)
+            norms_off = _pad(f)
+            f.write(self.norms.tobytes())
+            terms_off = _pad(f)
+            _write_strings(f, self.terms)
+            dict_off = _pad(f)
+            f.write(np.array(self.entries, dtype=DICT_ENTRY).tobytes())
+            postings_off = _pad(f)
+            self._postings.seek(0)
+            shutil.copyfileobj(self._postings, f)
+            flags = 0
+            if self._positions is not None:
+                flags |= FLAG_POSITIONS
+                positions_off = _pad(f)
+                f.write(np.array(self._position_offsets, dtype="<u8").tobytes())
+                self._positions.seek(0)
+                shutil.copyfileobj(self._positions, f)
+                f.write(FOOTER.pack(positions_off))
+            if self._stopwords:
+                flags |= FLAG_STOPWORDS
+
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, flags, len(self.doc_ids), len(self.terms),
+                                docs_off, norms_off, terms_off, dict_off, postings_off))
+        self._close_tmp()
+        # Reemplazo atómico para que los lectores nunca vean un archivo a medias.
+        os.replace(tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._close_tmp()
+
+    def _close_tmp(self):
+        self._postings.close()
+        if self._positions is not None:
+            self._positions.close()
+
+
+class SegmentReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = len(self._mm)
+
+        (magic, version, self.flags, self.n_docs, self.n_terms,
+         docs_off, norms_off, terms_off, dict_off, self._postings_off) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"'{path}' no es un segmento de índice válido.")
+        if version != VERSION:
+            raise ValueError(f"Versión de segmento no soportada: {version}")
+
+        self._doc_offsets = np.frombuffer(self._mm, dtype="<u4", count=self.n_docs + 1, offset=docs_off)
+        self._docs_blob = docs_off + self._doc_offsets.nbytes
+        self.norms = np.frombuffer(self._mm, dtype="<f4", count=self.n_docs, offset=norms_off)
+        self._term_offsets = np.frombuffer(self._mm, dtype="<u4", count=self.n_terms + 1, offset=terms_off)
+        self._terms_blob = terms_off + self._term_offsets.nbytes
+        self._dict = np.frombuffer(self._mm, dtype=DICT_ENTRY, count=self.n_terms, offset=dict_off)
+        self.has_positions = bool(self.flags & FLAG_POSITIONS)
+        self.has_stopwords = bool(self.flags & FLAG_STOPWORDS)
+        if self.has_positions:
+            (positions_off,) = FOOTER.unpack_from(self._mm, self.size - FOOTER.size)
+            self._position_offsets = np.frombuffer(self._mm, dtype="<u8", count=self.n_terms + 1,
+                                                   offset=positions_off)
+            self._positions_blob = positions_off + self._position_offsets.nbytes
+
+    def doc_id(self, doc):
+        start = self._docs_blob + int(self._doc_offsets[doc])
+        end = self._docs_blob + int(self._doc_offsets[doc + 1])
+        return self._mm[start:end].decode("utf-8")
+
+    def term(self, i):
+        start = self._terms_blob + int(self._term_offsets[i])
+        end = self._terms_blob + int(self._term_offsets[i + 1])
+        return self._mm[start:end]
+
+    def find(self, term):
+        """Búsqueda binaria en el diccionario; devuelve la posición o -1."""
+        key = term.encode("utf-8")
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_terms and self.term(lo) == key:
+            return lo
+        return -1
+
+    def iter_terms(self):
+        """Recorre el diccionario en orden: (término, posición)."""
+        for i in range(self.n_terms):
+            yield self.term(i).decode("utf-8"), i
+
+    def df(self, term):
+        return self.df_at(self.find(term))
+
+    def df_at(self, i):
+        return 0 if i < 0 else int(self._dict[i]["df"])
+
+    def max_tf_norm_at(self, i):
+        return 0.0 if i < 0 else float(self._dict[i]["max_tf_norm"])
+
+    def postings(self, term):
+        """Devuelve (doc_ids internos, TF) decodificados desde el mmap."""
+        return self.postings_at(self.find(term))
+
+    def postings_at(self, i):
+        if i < 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+        offset, length, df, _ = self._dict[i]
+        data = np.frombuffer(self._mm, dtype=np.uint8, count=int(length), offset=self._postings_off + int(offset))
+        return decode_postings(data, int(df))
+
+    def positions_at(self, i, tfs):
+        """
+        Posiciones del término i (tfs: sus TF, de postings_at) concatenadas en
+        el orden de sus postings; None si el segmento no guarda posiciones.
+        """
+        if not self.has_positions:
+            return None
+        if i < 0:
+            return np.empty(0, dtype=np.int64)
+        start, end = int(self._position_offsets[i]), int(self._position_offsets[i + 1])
+        data = np.frombuffer(self._mm, dtype=np.uint8, count=end - start, offset=self._positions_blob + start)
+        return decode_positions(data, tfs)
+
+    def close(self):
+        self._doc_offsets = self.norms = self._term_offsets = self._dict = None
+        self._position_offsets = None
+        try:
+            self._mm.close()
+        except BufferError:
+            # Aún hay vistas de postings vivas; el mmap se libera con ellas.
+            pass
@@ -1,39 +1,238 @@
 import os
 import math
 import json
+import heapq
+import shutil
+import tempfile
 from collections import defaultdict, Counter
-from backend.indexing.preprocessor import preprocess
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from backend.indexing.preprocessor import is_stopword_term, preprocess_batch
+from backend.indexing.segment import SegmentWriter
+
+# Estimaciones (en bytes) del costo de cada entrada del diccionario en memoria,
+# usadas para decidir cuándo volcar un bloque a disco.
+TERM_OVERHEAD = 120
+POSTING_SIZE = 64
+POSITION_SIZE = 8
+# Documentos que se tokenizan juntos con preprocess_batch.
+PREPROCESS_BATCH = 512
+
+
+def write_segment(output_path, doc_ids, term_postings, other_docs=0, other_df=None, positions=False,
+                  stopwords=False):
+    """
+    Calcula las normas TF-IDF finales y escribe el segmento binario.
+    term_postings: iterable de (term, [(doc interno, tf), ...]) ordenado por
+    término; con positions=True cada posting es (doc, tf, [posiciones]). El
+    DF de cada término es la longitud de su lista completa, así que el IDF no
+    depende del orden de los documentos.
+    other_docs / other_df: documentos y DF por término de los demás segmentos
+    de la tabla, para que el IDF de las normas sea el global.
+    stopwords: los postings incluyen stopwords (sólo para frases), que se
+    guardan pero no cuentan en las normas.
+    """
+    N = len(doc_ids) + other_docs
+    norms = np.zeros(len(doc_ids), dtype=np.float64)
+    with SegmentWriter(output_path, doc_ids, positions=positions, stopwords=stopwords) as writer:
+        for term, postings in term_postings:
+            docs = np.array([posting[0] for posting in postings], dtype=np.int32)
+            tf = np.array([posting[1] for posting in postings], dtype=np.int32)
+            if not is_stopword_term(term):
+                df = len(postings) + (other_df(term) if other_df else 0)
+                idf = math.log(N / (1 + df))
+                norms[docs] += (tf * idf) ** 2
+            term_positions = [p for posting in postings for p in posting[2]] if positions else None
+            writer.add_term(term, docs, tf, term_positions)
+        writer.set_norms(np.sqrt(norms))
+
+
+def convert_json_index(json_path, output_path):
+    """
+    Migra un index.json antiguo al formato binario. En ese formato el peso del
+    k-ésimo posting de un término se calculó con DF = k, así que el TF original
+    se recupera dividiendo por ese IDF y los pesos se recalculan con el DF real.
+    """
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    doc_ids = list(data["doc_norms"].keys())
+    internal = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+    N = len(doc_ids)
+
+    def term_postings():
+        for term in sorted(data["index"]):
+            postings = []
+            for k, (doc_id, w) in enumerate(data["index"][term]):
+                idf = math.log(N / (1 + k))
+                freq = max(1, round(w / idf)) if idf > 0 else 1
+                postings.append((internal[str(doc_id)], freq))
+            postings.sort()
+            yield term, postings
+
+    write_segment(output_path, doc_ids, term_postings())
+
+
+def _invert_chunk(tmp_dir, chunk_id, documents, memory_budget, positions=False):
+    """
+    Worker del modo paralelo: tokeniza e invierte un rango contiguo de
+    documentos [(doc interno, texto), ...] y devuelve sus bloques en disco.
+    """
+    indexer = SPIMIIndexer(positions=positions)
+    indexer.memory_budget = memory_budget
+    indexer._tmp_dir = tmp_dir
+    indexer._block_prefix = f"{chunk_id:05d}_"
+    indexer._invert(documents)
+    indexer._flush_block()
+    return indexer.blocks
+
 
 class SPIMIIndexer:
-    def __init__(self, output_path="data/Audio/index.json"):
+    def __init__(self, output_path="data/Audio/index.bin", memory_budget_mb=64, block_dir=None,
+                 other_docs=0, other_df=None, n_workers=1, chunk_size=None, positions=False):
         self.index = defaultdict(list)
-        self.doc_norms = {}
+        self.doc_ids = []
         self.output_path = output_path
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.block_dir = block_dir
+        self.blocks = []
+        self._block_bytes = 0
+        self._block_prefix = ""
+        # Con n_workers > 1 la primera pasada se reparte en un pool de procesos
+        # por trozos de chunk_size documentos (por defecto, 4 trozos por worker).
+        self.n_workers = max(1, n_workers or 1)
+        self.chunk_size = chunk_size
+        # Estadísticas del resto de la tabla cuando se indexa un segmento nuevo.
+        self.other_docs = other_docs
+        self.other_df = other_df
+        # Guardar también la posición de cada aparición (consultas por frase),
+        # incluidas las de las stopwords.
+        self.positions = positions
 
     def index_documents(self, documents):
-        N = len(documents)
+        """
+        Primera pasada: invierte los documentos guardando TF crudos por bloque.
+        Segunda pasada (merge): con el DF global ya exacto calcula el IDF de
+        cada término y las normas TF-IDF de cada documento.
+        """
+        self.doc_ids = []
+        self._open_block_dir()
 
-        for doc_id, text in documents.items():
-            tokens = preprocess(text)
-            tf = Counter(tokens)
-            norm = 0
+        try:
+            pairs = []
+            for doc_id, text in documents.items():
+                pairs.append((len(self.doc_ids), text))
+                self.doc_ids.append(str(doc_id))
 
-            for term, freq in tf.items():
-                # IDF usa el DF actual acumulado
-                df = len(set(post[0] for post in self.index[term])) if term in self.index else 0
-                idf = math.log(N / (1 + df))
-                tfidf = freq * idf
-                self.index[term].append((str(doc_id), tfidf))
-                norm += tfidf ** 2
+            if self.n_workers > 1 and len(pairs) > 1:
+                self._invert_parallel(pairs)
+            else:
+                self._invert(pairs)
+                self._flush_block()
+            self._save_index()
+        finally:
+            self._close_block_dir()
+
+    def _invert(self, pairs):
+        for start in range(0, len(pairs), PREPROCESS_BATCH):
+            batch = pairs[start:start + PREPROCESS_BATCH]
+            token_lists = preprocess_batch([text for _, text in batch], positions=self.positions)
+            for (doc, _), tokens in zip(batch, token_lists):
+                if self.positions:
+                    occurrences = defaultdict(list)
+                    for term, position in tokens:
+                        occurrences[term].append(position)
+                    for term, term_positions in occurrences.items():
+                        self._add_posting(term, doc, len(term_positions), term_positions)
+                else:
+                    tf = Counter(tokens)
+                    for term, freq in tf.items():
+                        self._add_posting(term, doc, freq)
+
+                if self._block_bytes >= self.memory_budget:
+                    self._flush_block()
+
+    def _invert_parallel(self, pairs):
+        """
+        Cada worker invierte un trozo contiguo y escribe sus propios bloques
+        ordenados; el merge k-way final es el mismo que en el modo secuencial.
+        Los bloques se concatenan en el orden de los trozos, así que los
+        postings siguen en orden de documento.
+        """
+        chunk_size = self.chunk_size or -(-len(pairs) // (4 * self.n_workers))
+        chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+        # El presupuesto de memoria se reparte entre los workers.
+        budget = max(1, self.memory_budget // self.n_workers)
+        with ProcessPoolExecutor(max_workers=self.n_workers) as pool:
+            results = pool.map(
+                _invert_chunk,
+                [self._tmp_dir] * len(chunks), range(len(chunks)), chunks, [budget] * len(chunks),
+                [self.positions] * len(chunks),
+            )
+            for blocks in results:
+                self.blocks.extend(blocks)
+
+    def _add_posting(self, term, doc, freq, positions=None):
+        postings = self.index[term]
+        if not postings:
+            self._block_bytes += TERM_OVERHEAD + len(term)
+        if positions is None:
+            postings.append((doc, freq))
+            self._block_bytes += POSTING_SIZE
+        else:
+            postings.append((doc, freq, positions))
+            self._block_bytes += POSTING_SIZE + POSITION_SIZE * len(positions)
+
+    def _open_block_dir(self):
+        out_dir = os.path.dirname(self.output_path) or "."
+        os.makedirs(out_dir, exist_ok=True)
+        base_dir = self.block_dir or out_dir
+        os.makedirs(base_dir, exist_ok=True)
+        self._tmp_dir = tempfile.mkdtemp(prefix="spimi_", dir=base_dir)
+        self.blocks = []
+
+    def _close_block_dir(self):
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        self.blocks = []
+
+    def _flush_block(self):
+        """Escribe el bloque actual ordenado por término y libera la memoria."""
+        if not self.index:
+            return
+        path = os.path.join(self._tmp_dir, f"block_{self._block_prefix}{len(self.blocks):05d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            for term in sorted(self.index):
+                f.write(term + "\t" + json.dumps(self.index[term]) + "\n")
+        self.blocks.append(path)
+        self.index = defaultdict(list)
+        self._block_bytes = 0
 
-            self.doc_norms[str(doc_id)] = math.sqrt(norm)
+    @staticmethod
+    def _read_block(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                term, postings = line.rstrip("\n").split("\t", 1)
+                yield term, postings
 
-        self._save_index()
+    def _merge_blocks(self):
+        """
+        Merge k-way de los bloques. Devuelve (term, postings) en orden
+        alfabético; los postings de cada término conservan el orden de los
+        bloques, que es el orden de los documentos.
+        """
+        readers = [self._read_block(path) for path in self.blocks]
+        current_term, current = None, []
+        for term, postings in heapq.merge(*readers, key=lambda item: item[0]):
+            if term != current_term:
+                if current_term is not None:
+                    yield current_term, current
+                current_term, current = term, []
+            current.extend(json.loads(postings))
+        if current_term is not None:
+            yield current_term, current
 
     def _save_index(self):
-        data = {
-            "index": {term: postings for term, postings in self.index.items()},
-            "doc_norms": self.doc_norms
-        }
-        with open(self.output_path, "w", encoding="utf-8") as f:
-            json.dump(data, f)
+        # Los términos se escriben a medida que salen del merge, sin
+        # reconstruir el diccionario completo en memoria.
+        write_segment(self.output_path, self.doc_ids, self._merge_blocks(),
+                      other_docs=self.other_docs, other_df=self.other_df, positions=self.positions,
+                      stopwords=self.positions)
@@ -0,0 +1,274 @@
+"""
+Índice de una tabla formado por varios segmentos inmutables.
+
+    data/<tabla>/index/manifest.json
+    data/<tabla>/index/seg_000001.bin
+    ...
+
+El manifest lista los segmentos en orden; cada uno cubre un rango contiguo de
+doc ids globales que empieza en "base". Agregar filas escribe un segmento
+nuevo sólo con ellas, así que el costo depende del lote y no de la tabla. Los
+segmentos pequeños se combinan luego en segundo plano (merge por niveles,
+como en un LSM tree). El IDF se calcula siempre con el DF global de todos los
+segmentos al consultar; las normas de cada segmento usan el N y el DF
+globales del momento en que se escribió ("stats_docs" en el manifest). Cuando
+la tabla crece más de NORM_DRIFT desde entonces, maybe_merge reescribe el
+segmento con las estadísticas actuales. Así las normas nunca se calculan con
+menos de 1 / (1 + NORM_DRIFT) de los documentos de la tabla; dentro de ese
+margen el coseno es aproximado (puede pasar levemente de 1) y el ranking
+puede diferir un poco del de un índice reconstruido desde cero. Como cada
+reescritura exige que la tabla crezca un NORM_DRIFT más, su costo amortizado
+es constante por documento agregado.
+Si la tabla se construyó con positions=True (queda en el manifest) todos sus
+segmentos guardan posiciones, también los que se agregan o combinan después.
+"""
+import heapq
+import json
+import math
+import os
+import threading
+import uuid
+from collections import defaultdict
+import numpy as np
+from backend.indexing.preprocessor import is_stopword_term
+from backend.indexing.segment import SegmentReader, segment_version, VERSION
+from backend.indexing.spimi import SPIMIIndexer, convert_json_index, write_segment
+
+MANIFEST = "manifest.json"
+# Crecimiento relativo de la tabla tras el cual se recalculan las normas de un segmento.
+NORM_DRIFT = 0.1
+
+# Un lock por directorio: appends y merges de una misma tabla no se pisan.
+_locks = defaultdict(threading.Lock)
+_merge_locks = defaultdict(threading.Lock)
+
+
+class TableIndex:
+    def __init__(self, index_dir, merge_factor=4, memory_budget_mb=64, n_workers=1, positions=False):
+        self.index_dir = index_dir
+        self.merge_factor = merge_factor
+        self.memory_budget_mb = memory_budget_mb
+        self.n_workers = n_workers
+        # Sólo se usa en replace; append y merge siguen lo que diga el manifest.
+        self.positions = positions
+        self.lock = _locks[os.path.abspath(index_dir)]
+        self.merge_lock = _merge_locks[os.path.abspath(index_dir)]
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.index_dir, MANIFEST)
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def load_manifest(self):
+        if not self.exists():
+            return {"generation": 0, "n_docs": 0, "segments": []}
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest):
+        manifest["n_docs"] = sum(seg["n_docs"] for seg in manifest["segments"])
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _segment_path(self, name):
+        return os.path.join(self.index_dir, name)
+
+    def _new_segment_name(self, manifest):
+        manifest["generation"] += 1
+        return f"seg_{manifest['generation']:06d}.bin"
+
+    def is_current(self):
+        """True si existe y todos sus segmentos están en el formato actual."""
+        if not self.exists():
+            return False
+        return all(
+            os.path.exists(self._segment_path(seg["name"]))
+            and segment_version(self._segment_path(seg["name"])) == VERSION
+            for seg in self.load_manifest()["segments"]
+        )
+
+    def _global_stats(self, segments, exclude=()):
+        """N y una función df(term) sumando los segmentos que no se reescriben."""
+        readers = [SegmentReader(self._segment_path(seg["name"]))
+                   for seg in segments if seg["name"] not in exclude]
+        other_docs = sum(reader.n_docs for reader in readers)
+
+        def other_df(term):
+            return sum(reader.df(term) for reader in readers)
+
+        return other_docs, other_df
+
+    def _remove_segments(self, names):
+        # Los lectores que ya tienen el archivo mapeado lo siguen viendo.
+        for name in names:
+            try:
+                os.remove(self._segment_path(name))
+            except FileNotFoundError:
+                pass
+
+    def replace(self, documents):
+        """Reconstruye la tabla completa con un único segmento."""
+        os.makedirs(self.index_dir, exist_ok=True)
+        with self.lock:
+            manifest = self.load_manifest()
+            old = [seg["name"] for seg in manifest["segments"]]
+            name = self._new_segment_name(manifest)
+            indexer = SPIMIIndexer(self._segment_path(name), memory_budget_mb=self.memory_budget_mb,
+                                   n_workers=self.n_workers, positions=self.positions)
+            indexer.index_documents(documents)
+            n_docs = len(indexer.doc_ids)
+            manifest["segments"] = [{"name": name, "base": 0, "n_docs": n_docs, "stats_docs": n_docs}]
+            manifest["positions"] = self.positions
+            self._write_manifest(manifest)
+            self._remove_segments(old)
+        return manifest
+
+    def append(self, documents):
+        """
+        Indexa sólo los documentos nuevos como un segmento más. Sus doc ids
+        globales continúan desde el final de la tabla.
+        """
+        os.makedirs(self.index_dir, exist_ok=True)
+        with self.lock:
+            manifest = self.load_manifest()
+            base = manifest["n_docs"]
+            other_docs, other_df = self._global_stats(manifest["segments"])
+            name = self._new_segment_name(manifest)
+            indexer = SPIMIIndexer(self._segment_path(name), memory_budget_mb=self.memory_budget_mb,
+                                   other_docs=other_docs, other_df=other_df, n_workers=self.n_workers,
+                                   positions=manifest.get("positions", False))
+            indexer.index_documents(documents)
+            n_docs = len(indexer.doc_ids)
+            manifest["segments"].append({"name": name, "base": base, "n_docs": n_docs,
+                                         "stats_docs": other_docs + n_docs})
+            self._write_manifest(manifest)
+        return manifest
+
+    def import_json(self, json_path):
+        """Migra un index.json antiguo como único segmento de la tabla."""
+        os.makedirs(self.index_dir, exist_ok=True)
+        with self.lock:
+            manifest = self.load_manifest()
+            old = [seg["name"] for seg in manifest["segments"]]
+            name = self._new_segment_name(manifest)
+            convert_json_index(json_path, self._segment_path(name))
+            n_docs = SegmentReader(self._segment_path(name)).n_docs
+            manifest["segments"] = [{"name": name, "base": 0, "n_docs": n_docs, "stats_docs": n_docs}]
+            manifest["positions"] = False
+            self._write_manifest(manifest)
+            self._remove_segments(old)
+
+    def _level(self, n_docs):
+        return int(math.log(max(n_docs, 1), self.merge_factor))
+
+    def _pick_merge(self, segments):
+        """
+        Busca merge_factor segmentos contiguos del mismo nivel
+        (log_merge_factor del tamaño). Devuelve (inicio, fin) o None.
+        """
+        levels = [self._level(seg["n_docs"]) for seg in segments]
+        start = 0
+        for i in range(1, len(segments) + 1):
+            if i == len(segments) or levels[i] != levels[start]:
+                if i - start >= self.merge_factor:
+                    return start, start + self.merge_factor
+                start = i
+        return None
+
+    def maybe_merge(self):
+        """
+        Combina segmentos mientras la política encuentre candidatos y luego
+        reescribe los que tengan normas desfasadas.
+        """
+        # Un solo merge a la vez por tabla; si ya hay uno corriendo, él sigue.
+        if not self.merge_lock.acquire(blocking=False):
+            return
+        try:
+            while self.merge_once() or self.refresh_once():
+                pass
+        finally:
+            self.merge_lock.release()
+
+    def merge_once(self):
+        manifest = self.load_manifest()
+        window = self._pick_merge(manifest["segments"])
+        if window is None:
+            return False
+        return self._rewrite(manifest, manifest["segments"][window[0]:window[1]])
+
+    def refresh_once(self):
+        """Reescribe el primer segmento cuyas normas usan un N desfasado más de NORM_DRIFT."""
+        manifest = self.load_manifest()
+        for seg in manifest["segments"]:
+            # Manifests antiguos: el segmento vio al menos la tabla hasta su final.
+            stats_docs = seg.get("stats_docs", seg["base"] + seg["n_docs"])
+            if manifest["n_docs"] > stats_docs * (1 + NORM_DRIFT):
+                return self._rewrite(manifest, [seg])
+        return False
+
+    def _rewrite(self, manifest, chosen):
+        """
+        Reemplaza los segmentos contiguos chosen por uno solo con normas
+        calculadas con las estadísticas globales actuales.
+        """
+        names = [seg["name"] for seg in chosen]
+
+        # El segmento combinado se escribe fuera del lock; los segmentos de
+        # origen son inmutables y un append sólo agrega al final.
+        other_docs, other_df = self._global_stats(manifest["segments"], exclude=names)
+        readers = [(seg["base"], SegmentReader(self._segment_path(seg["name"]))) for seg in chosen]
+        base = chosen[0]["base"]
+        doc_ids = [reader.doc_id(d) for _, reader in readers for d in range(reader.n_docs)]
+        positions = all(reader.has_positions for _, reader in readers)
+        # Las stopwords se conservan sólo si todos las tienen (segmentos nuevos).
+        stopwords = positions and all(reader.has_stopwords for _, reader in readers)
+        tmp_path = self._segment_path(f"merge_{uuid.uuid4().hex}.tmp")
+        write_segment(tmp_path, doc_ids, self._merged_postings(readers, base, positions, stopwords),
+                      other_docs=other_docs, other_df=other_df, positions=positions, stopwords=stopwords)
+
+        with self.lock:
+            manifest = self.load_manifest()
+            current = [seg["name"] for seg in manifest["segments"]]
+            if not all(n in current for n in names):
+                # La tabla se reconstruyó mientras tanto; se descarta el merge.
+                os.remove(tmp_path)
+                return False
+            name = self._new_segment_name(manifest)
+            os.replace(tmp_path, self._segment_path(name))
+            pos = current.index(names[0])
+            merged = {"name": name, "base": base, "n_docs": len(doc_ids),
+                      "stats_docs": other_docs + len(doc_ids)}
+            manifest["segments"][pos:pos + len(names)] = [merged]
+            self._write_manifest(manifest)
+            self._remove_segments(names)
+        return True
+
+    @staticmethod
+    def _merged_postings(readers, base, positions=False, stopwords=False):
+        """Merge k-way de los diccionarios, reubicando los doc ids locales."""
+        def tagged(k, reader):
+            for term, i in reader.iter_terms():
+                if stopwords or not is_stopword_term(term):
+                    yield term, k, i
+
+        iterators = [tagged(k, reader) for k, (_, reader) in enumerate(readers)]
+        current_term, current = None, []
+        for term, k, i in heapq.merge(*iterators):
+            if term != current_term:
+                if current_term is not None:
+                    yield current_term, current
+                current_term, current = term, []
+            seg_base, reader = readers[k]
+            docs, tfs = reader.postings_at(i)
+            offset = seg_base - base
+            if positions:
+                split = np.split(reader.positions_at(i, tfs), np.cumsum(tfs)[:-1])
+                current.extend(zip((docs + offset).tolist(), tfs.tolist(), (p.tolist() for p in split)))
+            else:
+                current.extend(zip((docs + offset).tolist(), tfs.tolist()))
+        if current_term is not None:
+            yield current_term, current
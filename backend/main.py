@@ -1,26 +1,77 @@
-from fastapi import FastAPI, Query, UploadFile, File, HTTPException,Form
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Query, UploadFile, File, HTTPException,Form, BackgroundTasks
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from backend.indexing.search import SPIMISearcher
-from backend.indexing.spimi import SPIMIIndexer
+from backend.indexing.registry import IndexRegistry
+from backend.indexing.result_cache import ResultCache
+from backend.indexing.preprocessor import preprocess
+from backend.indexing.query_plan import plan_tokens, tokenize_plan, tokenize_plans
 from backend.audio_processing import transcribe_audio
 from backend.ai_query_parser import parse_sql_query
+from backend.audio_search import AudioSearchPool, PoolSaturated
+from concurrent.futures.process import BrokenProcessPool
 from backend.audio_indexer import AudioIndexer
-from backend.models import SearchResponse, SQLQuery
-from backend.utils import ensure_identifier_column, detect_text_column, get_audio_files
+from backend.metrics import Metrics, QueryLogWriter
+from backend.models import SearchResponse, SQLQuery, BatchSearchQuery, SQLBatchQuery
+from backend.utils import ensure_identifier_column, detect_text_column, get_audio_files, get_index_path, get_index_table, get_metadata_store
+from backend.utils import migrate_metadata_stores
+from backend.utils import field_index_dir, get_field_index_paths, load_fields, save_fields, table_lock
+from backend.utils import remove_unused_field_dirs
+from backend.indexing.table_index import TableIndex
+from backend.sql_search import TableSearch
 from typing import List
 import pandas as pd
-import csv
 import os
 from datetime import datetime
 import time
-import uuid
 import json
-import pydub
-from pydub import AudioSegment
+import tempfile
+import shutil
 
 app = FastAPI()
 
+# Buscadores abiertos compartidos entre requests; se reabren si el índice cambia.
+SEARCHER_CACHE_BYTES = 512 * 1024 * 1024
+searchers = IndexRegistry(SPIMISearcher, max_bytes=SEARCHER_CACHE_BYTES)
+# Resultados de consultas repetidas, por versión del índice de cada tabla.
+RESULT_CACHE_BYTES = 64 * 1024 * 1024
+RESULT_CACHE_TTL = 300
+results_cache = ResultCache(max_bytes=RESULT_CACHE_BYTES, ttl=RESULT_CACHE_TTL)
+# Búsqueda por audio en un pool de procesos aparte; cada worker mantiene el
+# índice acústico abierto y lo reabre sólo si se reescribe (audio_format.py).
+AUDIO_INDEX_PATH = "multimedia/audio_index"
+# Formato anterior; al arrancar se convierte a AUDIO_INDEX_PATH si hace falta.
+LEGACY_AUDIO_INDEX_PATH = "multimedia/audio_index.pkl"
+AUDIO_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+AUDIO_UPLOAD_CHUNK = 1024 * 1024
+audio_pool = AudioSearchPool(AUDIO_INDEX_PATH, n_workers=AUDIO_WORKERS)
+# Latencia por etapa en /metrics; los logs CSV se escriben desde un hilo aparte
+# (QUERY_LOG = False los desactiva).
+metrics = Metrics()
+metrics.add_gauges("result_cache", results_cache.stats)
+metrics.add_gauges("searcher_cache", searchers.stats)
+QUERY_LOG = True
+query_log = QueryLogWriter(
+    "analisis/log.csv", ["tabla", "tiempo_respuesta", "query_text", "top_k", "fecha"]
+) if QUERY_LOG else None
+audio_log = QueryLogWriter(
+    "analisis/logs_multimedia.csv", ["metodo", "tiempo_respuesta"]
+) if QUERY_LOG else None
+
+AUDIO_SATURATED_RESPONSE = {"error": "Demasiadas búsquedas por audio en curso."}
+
+
+@app.middleware("http")
+async def reject_saturated_audio(request, call_next):
+    # Corre antes de que FastAPI lea el multipart: con el pool lleno se
+    # responde 429 sin recibir el archivo. Se registra antes que CORS para
+    # que la respuesta también lleve sus cabeceras.
+    if request.method == "POST" and request.url.path == "/search_audio" and audio_pool.saturated():
+        return JSONResponse(status_code=429, content=AUDIO_SATURATED_RESPONSE, headers={"Retry-After": "1"})
+    return await call_next(request)
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -32,13 +83,38 @@ app.add_middleware(
 
 @app.get("/search", response_model=List[SearchResponse])
 def search(q: str, table: str = Query(...), k: int = 5):
-    index_path = f"data/{table}/index.json"
+    start = time.perf_counter()
+    index_path = get_index_path(table)
     if not os.path.exists(index_path):
         raise HTTPException(status_code=404, detail=f"Índice para tabla '{table}' no encontrado.")
     
-    searcher = SPIMISearcher(index_path=index_path)
-    results = searcher.search(q, top_k=k)
-    return [{"doc_id": doc_id, "score": score} for doc_id, score in results]
+    with metrics.stage("preprocess"):
+        tokens = preprocess(q)
+    key = ResultCache.key(table, IndexRegistry._version(index_path), tokens, k)
+    output = results_cache.get(key)
+    if output is None:
+        searcher = searchers.get(index_path)
+        timings = {}
+        results = searcher.search_tokens(tokens, top_k=k, timings=timings)
+        metrics.observe_stages(timings)
+        output = [{"doc_id": searcher.doc_id(doc), "score": score} for doc, score in results]
+        results_cache.put(key, output)
+    metrics.requests.observe("/search", time.perf_counter() - start)
+    return output
+
+
+@app.post("/search_batch", response_model=List[List[SearchResponse]])
+def search_batch(payload: BatchSearchQuery):
+    index_path = get_index_path(payload.table)
+    if not os.path.exists(index_path):
+        raise HTTPException(status_code=404, detail=f"Índice para tabla '{payload.table}' no encontrado.")
+
+    searcher = searchers.get(index_path)
+    results = searcher.search_many(payload.queries, top_k=payload.k)
+    return [
+        [{"doc_id": searcher.doc_id(doc), "score": score} for doc, score in hits]
+        for hits in results
+    ]
 
 
 # @app.post("/search_audio")
@@ -96,204 +172,349 @@ def search(q: str, table: str = Query(...), k: int = 5):
 #         "tiempo_indexado_ms": inv_time_ms
 #     }
 
-@app.post("/search_audio")
-async def search_from_audio(file: UploadFile = File(...), k: int = 5):
-    print("🔧 Endpoint /search_audio activado.")
-    os.makedirs("temp_audio", exist_ok=True)
+@app.on_event("startup")
+def migrate_metadata():
+    # Las tablas antiguas sólo tienen metadata.csv; se importa acá y no al consultar.
+    migrate_metadata_stores()
 
-    # Generar nombre temporal
-    temp_filename = f"temp_audio/{uuid.uuid4()}.wav"
 
+@app.on_event("startup")
+def migrate_audio_index():
+    # Instalaciones anteriores sólo tienen el .pkl: se convierte una vez. Si
+    # la conversión falla se sigue sirviendo el .pkl (AudioIndexer lo lee).
+    if os.path.exists(AUDIO_INDEX_PATH) or not os.path.exists(LEGACY_AUDIO_INDEX_PATH):
+        return
     try:
-        contents = await file.read()
-        print(f"📥 Archivo recibido: {file.filename}, tamaño: {len(contents)} bytes")
-
-        with open(temp_filename, "wb") as f:
-            f.write(contents)
-        print(f"✅ Archivo guardado como {temp_filename}")
-
-        if temp_filename.endswith(".mp3"):
-            print("⚠️ Archivo es mp3, convirtiendo a WAV...")
-            audio = AudioSegment.from_file(temp_filename, format="mp3")
-            temp_wav = temp_filename.replace(".mp3", ".wav")
-            audio.export(temp_wav, format="wav")
-            os.remove(temp_filename)
-            temp_filename = temp_wav
-            print(f"✅ Conversión exitosa: {temp_filename}")
-
-        if not os.path.exists(temp_filename):
-            print("❌ Error: archivo no existe después de guardar")
-            return JSONResponse(status_code=500, content={"error": f"Archivo no guardado: {temp_filename}"})
-        elif os.stat(temp_filename).st_size == 0:
-            print("❌ Error: archivo vacío")
-            return JSONResponse(status_code=500, content={"error": f"Archivo vacío: {temp_filename}"})
-
-        print("📦 Cargando índice acústico...")
-        index_path = "multimedia/audio_index.pkl"
-        if not os.path.exists(index_path):
-            print("❌ No se encontró el índice acústico.")
-            return JSONResponse(status_code=500, content={"error": "No se encontró el índice acústico."})
-
         indexer = AudioIndexer()
-        indexer.load(index_path)
-        print("✅ Índice cargado con éxito.")
-
-        print("🔁 Ejecutando KNN secuencial...")
-        t0 = time.time()
-        knn_seq = indexer.knn_secuencial(temp_filename, k=k)
-        t_seq = round((time.time() - t0) * 1000, 2)
-        print(f"✅ KNN secuencial listo en {t_seq} ms")
-
-        print("⚡ Ejecutando KNN con índice invertido...")
-        t0 = time.time()
-        knn_inv = indexer.knn_invertido(temp_filename, k=k)
-        t_inv = round((time.time() - t0) * 1000, 2)
-        print(f"✅ KNN invertido listo en {t_inv} ms")
-
-        print("📝 Guardando log en CSV...")
-        os.makedirs("analisis", exist_ok=True)
-        log_path = "analisis/logs_multimedia.csv"
-        df_log = pd.DataFrame([
-            {"metodo": "KNN-secuencial", "tiempo_respuesta": t_seq},
-            {"metodo": "KNN-Indexado", "tiempo_respuesta": t_inv}
-        ])
-        if os.path.exists(log_path):
-            df_log.to_csv(log_path, mode="a", header=False, index=False)
-        else:
-            df_log.to_csv(log_path, index=False)
-        print("✅ Log guardado.")
+        indexer.load(LEGACY_AUDIO_INDEX_PATH)
+        indexer.save(AUDIO_INDEX_PATH)
+    except Exception as e:
+        print(f"⚠️ No se pudo convertir {LEGACY_AUDIO_INDEX_PATH}: {e}")
+        audio_pool.index_path = LEGACY_AUDIO_INDEX_PATH
 
-        return {
-            "knn_secuencial": [{"doc_id": d, "score": s} for d, s in knn_seq],
-            "knn_invertido": [{"doc_id": d, "score": s} for d, s in knn_inv],
-            "tiempos": {"secuencial": t_seq, "invertido": t_inv}
-        }
 
-    except Exception as e:
-        print(f"💥 Excepción atrapada: {e}")
-        return JSONResponse(status_code=500, content={"error": str(e)})
+@app.on_event("shutdown")
+def shutdown_audio_pool():
+    audio_pool.shutdown()
 
-    finally:
-        try:
-            os.remove(temp_filename)
-            print(f"🧹 Archivo temporal eliminado: {temp_filename}")
-        except:
-            print(f"⚠️ No se pudo eliminar: {temp_filename}")
 
-@app.post("/search_sql")
-def search_from_sql(payload: SQLQuery):
-    table_name, query_text, k, selected_fields = parse_sql_query(payload.query)
-    print("TABLA: ", table_name)
-    print("QUERY: ", query_text)
-    index_path = f"data/{table_name}/index.json"
-    metadata_path = f"data/{table_name}/metadata.csv"
+@app.on_event("shutdown")
+def flush_query_logs():
+    for writer in (query_log, audio_log):
+        if writer is not None:
+            writer.close()
 
-    if not query_text or not os.path.exists(index_path) or not os.path.exists(metadata_path):
-        raise HTTPException(status_code=400, detail="Consulta inválida o recursos no encontrados.")
+
+def save_upload(source, directory, suffix):
+    """Copia por bloques un archivo subido a un temporal; devuelve (ruta, bytes)."""
+    with tempfile.NamedTemporaryFile(dir=directory, suffix=suffix, delete=False) as tmp:
+        try:
+            shutil.copyfileobj(source, tmp, AUDIO_UPLOAD_CHUNK)
+        except BaseException:
+            tmp.close()
+            os.remove(tmp.name)
+            raise
+        return tmp.name, tmp.tell()
 
 
-    start_time = time.time()
+@app.post("/search_audio")
+async def search_from_audio(file: UploadFile = File(...), k: int = 5):
+    if not os.path.exists(audio_pool.index_path):
+        return JSONResponse(status_code=500, content={"error": "No se encontró el índice acústico."})
 
-    # Buscar
-    searcher = SPIMISearcher(index_path=index_path)
-    results = searcher.search(query_text, top_k=k)
+    # El archivo ya se recibió: reject_saturated_audio descarta la mayoría de
+    # los pedidos con el pool lleno antes de leerlo, pero el lugar se reserva
+    # acá, porque mientras se subía otros pedidos pueden haber llenado el pool.
+    try:
+        audio_pool.acquire()
+    except PoolSaturated:
+        return JSONResponse(status_code=429, content=AUDIO_SATURATED_RESPONSE, headers={"Retry-After": "1"})
 
-    # Cargar metadata
-    df = pd.read_csv(metadata_path)
+    os.makedirs("temp_audio", exist_ok=True)
+    # Se conserva la extensión para que librosa detecte el formato.
+    suffix = os.path.splitext(file.filename or "")[1] or ".wav"
+    temp_filename = None
 
-    id_column = None
-    if "track_id" in df.columns:
-        id_column = "track_id"
-    if "id" in df.columns:
-        id_column = "id"
-    else:
-        df["id"] = df.index 
-        id_column = "id"
-        df.to_csv(metadata_path, index=False)
+    try:
+        # Starlette ya dejó el archivo en un SpooledTemporaryFile; copiarlo a
+        # disco es I/O bloqueante, así que se hace en un hilo y no en el event loop.
+        temp_filename, size = await run_in_threadpool(save_upload, file.file, "temp_audio", suffix)
+        if size == 0:
+            return JSONResponse(status_code=500, content={"error": f"Archivo vacío: {file.filename}"})
+
+        start = time.perf_counter()
+        result = await audio_pool.search(temp_filename, k)
+        metrics.requests.observe("/search_audio", time.perf_counter() - start)
+        tiempos = result["tiempos"]
+        metrics.stages.observe("audio_encode", tiempos["codificacion"] / 1000)
+        metrics.stages.observe("audio_knn_secuencial", tiempos["secuencial"] / 1000)
+        metrics.stages.observe("audio_knn_invertido", tiempos["invertido"] / 1000)
+
+        if audio_log is not None:
+            audio_log.log({"metodo": "Codificacion-consulta", "tiempo_respuesta": tiempos["codificacion"]})
+            audio_log.log({"metodo": "KNN-secuencial", "tiempo_respuesta": tiempos["secuencial"]})
+            audio_log.log({"metodo": "KNN-Indexado", "tiempo_respuesta": tiempos["invertido"]})
+
+        return result
+
+    except BrokenProcessPool:
+        # El pool ya se reemplazó; sólo falla esta consulta.
+        return JSONResponse(status_code=503, content={"error": "El worker de búsqueda por audio se cayó; intente de nuevo."},
+                            headers={"Retry-After": "1"})
 
-    df.set_index(id_column, inplace=True)
-    df.index = df.index.map(str)
-    
+    except Exception as e:
+        print(f"💥 Excepción atrapada: {e}")
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+    finally:
+        audio_pool.release()
+        if temp_filename is not None:
+            try:
+                os.remove(temp_filename)
+            except OSError:
+                print(f"⚠️ No se pudo eliminar: {temp_filename}")
+
+def enrich_results(results, rows, fields):
     output = []
-    for doc_id, score in results:
-        if doc_id in df.index:
-            row = df.loc[doc_id]
-            # enriched = {f: row.get(f, "") for f in selected_fields}
-            # enriched["score"] = score
-            # output.append(enriched)
-            
-            enriched = {f: row.get(f, "") for f in selected_fields}
-            enriched = {k: (v.item() if hasattr(v, "item") else v) for k, v in enriched.items()} # convertir todos los valores a tipos nativos
+    for doc, score in results:
+        if doc in rows:
+            enriched = {f: rows[doc].get(f, "") for f in fields}
             enriched["score"] = float(score)  # asegurar tipo nativo
             output.append(enriched)
+    return output
 
 
+@app.post("/search_sql")
+def search_from_sql(payload: SQLQuery):
+    request_start = time.perf_counter()
+    with metrics.stage("parse"):
+        table_name, query_text, k, selected_fields, plan = parse_sql_query(payload.query)
+    index_path = get_index_path(table_name)
+    store = get_metadata_store(table_name)
+
+    # Un WHERE sólo con comparaciones es válido; sin WHERE utilizable, no.
+    if plan is None or not os.path.exists(index_path) or not store.exists():
+        raise HTTPException(status_code=400, detail="Consulta inválida o recursos no encontrados.")
 
-    print("Resultados crudos del índice:", results)
-    print("Índice del DataFrame:", df.index.tolist()[:10])
-    print("Tipos de doc_id en results:", [type(r[0]) for r in results])
-    print("Tipos de df.index:", type(df.index[0]))
-
-    end_time = time.time()
-    elapsed_ms = round((end_time - start_time) * 1000, 2)
-
-    # Guardar log
-    log_path = "analisis/log.csv"
-    log_row = {
-        "tabla": table_name,
-        "tiempo_respuesta": elapsed_ms,
-        "query_text": query_text,
-        "top_k": k,
-        "fecha": datetime.now().isoformat(timespec="seconds")
-    }
-
-    file_exists = os.path.exists(log_path)
-    with open(log_path, "a", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=log_row.keys())
-        if not file_exists:
-            writer.writeheader()
-        writer.writerow(log_row)
+    start_time = time.perf_counter()
+
+    with metrics.stage("preprocess"):
+        plan = tokenize_plan(plan)
+    key = ResultCache.key(table_name, IndexRegistry._version(index_path), plan_tokens(plan), k,
+                          selected_fields, plan)
+    output = results_cache.get(key)
+    if output is None:
+        # Buscar: cada LIKE en el índice de su columna y las comparaciones en la metadata.
+        table_search = TableSearch(index_path, get_field_index_paths(table_name), store, searchers.get)
+        timings = {}
+        try:
+            results = table_search.search(plan, top_k=k, timings=timings)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        metrics.observe_stages(timings)
+
+        # Sólo se leen las k filas encontradas y las columnas seleccionadas.
+        with metrics.stage("metadata"):
+            rows = store.fetch([doc for doc, _ in results], selected_fields)
+            output = enrich_results(results, rows, selected_fields)
+        results_cache.put(key, output)
+
+    elapsed_ms = round((time.perf_counter() - start_time) * 1000, 2)
+
+    if query_log is not None:
+        query_log.log({
+            "tabla": table_name,
+            "tiempo_respuesta": elapsed_ms,
+            "query_text": query_text,
+            "top_k": k,
+            "fecha": datetime.now().isoformat(timespec="seconds")
+        })
+
+    # Se serializa acá para poder medirlo.
+    with metrics.stage("serialize"):
+        response = JSONResponse(content=output)
+    metrics.requests.observe("/search_sql", time.perf_counter() - request_start)
+    return response
+
+
+@app.post("/search_sql_batch")
+def search_from_sql_batch(payload: SQLBatchQuery):
+    """
+    Varias consultas SQL sobre una misma tabla: comparten el índice, los
+    postings decodificados y una sola lectura de metadata para todo el lote.
+    """
+    if not payload.queries:
+        raise HTTPException(status_code=400, detail="El lote no tiene consultas.")
+    parsed = [parse_sql_query(query) for query in payload.queries]
+    tables = {table_name for table_name, _, _, _, _ in parsed}
+    if len(tables) != 1:
+        raise HTTPException(status_code=400, detail="Todas las consultas del lote deben usar la misma tabla.")
+    table_name = tables.pop()
+    index_path = get_index_path(table_name)
+    store = get_metadata_store(table_name)
+    if any(plan is None for _, _, _, _, plan in parsed) or not os.path.exists(index_path) or not store.exists():
+        raise HTTPException(status_code=400, detail="Consulta inválida o recursos no encontrados.")
 
+    # Búsquedas en el diccionario y postings decodificados compartidos por el lote.
+    plans = tokenize_plans([plan for _, _, _, _, plan in parsed])
+    table_search = TableSearch(index_path, get_field_index_paths(table_name), store, searchers.get)
+    try:
+        results = [table_search.search(plan, k) for plan, (_, _, k, _, _) in zip(plans, parsed)]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    return output
+    docs = {doc for hits in results for doc, _ in hits}
+    fields = list(dict.fromkeys(f for _, _, _, selected, _ in parsed for f in selected))
+    rows = store.fetch(sorted(docs), fields)
+    return [enrich_results(hits, rows, selected) for hits, (_, _, _, selected, _) in zip(results, parsed)]
 
 
 @app.post("/insert_csv")
 def insert_csv(
+    background_tasks: BackgroundTasks,
     table: str = Form(...),
     file: UploadFile = File(...),
     id_column: str = Form(None),
-    text_column: str = Form(None)
+    text_column: str = Form(None),
+    mode: str = Form("replace"),
+    workers: int = Form(1),
+    fields: str = Form(None),
+    positions: bool = Form(False)
 ):
+    """
+    fields: columnas de texto (separadas por coma) que tienen además su propio
+    índice para los LIKE sobre esa columna. Por defecto, todas las de texto.
+    positions: guardar las posiciones de los términos, y también de las
+    stopwords, para buscar frases exactas (LIKE '"..."'); en modo append se
+    mantiene lo elegido al crear la tabla.
+    """
+    if mode not in ("replace", "append"):
+        return JSONResponse(status_code=400, content={"error": "mode debe ser 'replace' o 'append'."})
+    # Nunca más procesos que CPUs, pida lo que pida el request.
+    workers = max(1, min(workers, os.cpu_count() or 1))
 
     os.makedirs(f"data/{table}", exist_ok=True)
     df = pd.read_csv(file.file)
+    original_columns = set(df.columns)
 
     df, used_id = ensure_identifier_column(df, preferred=id_column)
 
-    try:
-        used_text = detect_text_column(df, preferred=text_column)
-    except ValueError:
-        return JSONResponse(
-            status_code=400,
-            content={"error": "No se encontró una columna textual válida para indexar."}
-        )
-
     metadata_path = f"data/{table}/metadata.csv"
-    df.to_csv(metadata_path, index=False)
+    # Desde leer el n_docs de la tabla hasta el último índice, para que dos
+    # cargas a la vez no repitan doc ids entre metadata, SQLite e índices.
+    with table_lock(table):
+        table_index = get_index_table(table, n_workers=workers, positions=positions)
+        append = mode == "append"
+        if append:
+            # Una tabla antigua (index.json, sólo metadata.csv) se migra antes
+            # de agregarle filas; si aun así no se puede, nunca se reemplaza.
+            get_index_path(table)
+            get_metadata_store(table, migrate=True)
+            if not table_index.exists() or not os.path.exists(metadata_path):
+                return JSONResponse(
+                    status_code=409,
+                    content={"error": f"La tabla '{table}' no tiene índice y metadata.csv; cárguela con mode=replace."}
+                )
+
+        # En modo append se indexa la misma columna con que se creó la tabla.
+        existing_text = load_fields(table)["text_column"] if append else None
+        if existing_text is not None:
+            if text_column is not None and text_column != existing_text:
+                return JSONResponse(
+                    status_code=400,
+                    content={"error": f"La tabla indexa la columna '{existing_text}', no '{text_column}'."}
+                )
+            if existing_text not in df.columns:
+                return JSONResponse(
+                    status_code=400,
+                    content={"error": f"Falta la columna de texto de la tabla: {existing_text}"}
+                )
+            used_text = existing_text
+        else:
+            try:
+                used_text = detect_text_column(df, preferred=text_column)
+            except ValueError:
+                return JSONResponse(
+                    status_code=400,
+                    content={"error": "No se encontró una columna textual válida para indexar."}
+                )
+
+        if fields is None:
+            field_names = [c for c in df.columns if df[c].dtype == object and c not in (used_id, used_text)]
+        else:
+            field_names = [c.strip() for c in fields.split(",") if c.strip() and c.strip() != used_text]
+        unknown = [c for c in field_names if c not in df.columns]
+        if unknown:
+            return JSONResponse(status_code=400, content={"error": f"Columnas inexistentes: {', '.join(unknown)}"})
+
+        store = get_metadata_store(table, migrate=append)
+
+        # En modo append las filas nuevas continúan la numeración de la tabla.
+        base = table_index.load_manifest()["n_docs"] if append else 0
+        if append:
+            if used_id not in original_columns:
+                df[used_id] = df[used_id] + base
+            columns = pd.read_csv(metadata_path, nrows=0).columns
+            df.reindex(columns=columns).to_csv(metadata_path, mode="a", header=False, index=False)
+            store.append(df, base)
+        else:
+            df.to_csv(metadata_path, index=False)
+            store.replace(df)
+
+        documents = df[used_text].astype(str).tolist()
+        documents = {base + i: doc for i, doc in enumerate(documents)}
+        if append:
+            table_index.append(documents)
+            background_tasks.add_task(table_index.maybe_merge)
+        else:
+            table_index.replace(documents)
+        searchers.invalidate(table_index.manifest_path)
 
-    documents = df[used_text].astype(str).tolist()
-    indexer = SPIMIIndexer(f"data/{table}/index.json")
-    indexer.index_documents({i: doc for i, doc in enumerate(documents)}) # {i: doc for i, doc in enumerate(documents)}
-    indexer._save_index()
+        # Un índice por columna de texto; todos comparten los doc ids de la tabla.
+        # En modo append se mantienen las columnas con que se creó la tabla.
+        if append:
+            field_dirs = load_fields(table)["fields"]
+        else:
+            # Cada índice se reemplaza en su lugar (TableIndex.replace cambia el
+            # manifest de una vez) y los directorios viejos se borran recién
+            # después de escribir fields.json, así una consulta en curso nunca
+            # encuentra un índice a medio borrar.
+            field_dirs = {c: field_index_dir(table, c, i) for i, c in enumerate(field_names)}
+        for column, index_dir in field_dirs.items():
+            field_index = TableIndex(index_dir, n_workers=workers, positions=positions)
+            values = df[column].fillna("").astype(str) if column in df.columns else [""] * len(df)
+            field_documents = {base + i: doc for i, doc in enumerate(values)}
+            if append:
+                field_index.append(field_documents)
+                background_tasks.add_task(field_index.maybe_merge)
+            else:
+                field_index.replace(field_documents)
+            searchers.invalidate(field_index.manifest_path)
+        save_fields(table, used_text, field_dirs)
+        if not append:
+            remove_unused_field_dirs(table, field_dirs.values())
+        results_cache.invalidate(table)
 
     return {
         "message": f"Tabla '{table}' cargada e indexada exitosamente.",
         "id_column": used_id,
-        "text_column": used_text
+        "text_column": used_text,
+        "fields": list(field_dirs),
+        "mode": "append" if append else "replace",
+        "rows": base + len(documents)
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/cache_stats")
+def cache_stats():
+    return {"results": results_cache.stats(), "searchers": searchers.stats()}
+
+
 @app.post("/preview_csv")
 def preview_csv(file: UploadFile = File(...)):
     try:
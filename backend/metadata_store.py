@@ -0,0 +1,152 @@
+"""
+Metadata de una tabla en SQLite (data/<tabla>/metadata.db).
+
+Cada fila se guarda con rowid = doc id global del índice, así que enriquecer
+k resultados son k búsquedas por clave primaria que leen sólo las columnas
+pedidas, sin importar el tamaño de la tabla. Se escribe únicamente al cargar
+datos (/insert_csv) o al migrar el metadata.csv de una tabla antigua al
+arrancar; las consultas abren la base en modo sólo lectura.
+
+Las columnas numéricas y las categóricas (pocos valores distintos) tienen un
+índice de SQLite, así que los predicados de /search_sql sobre ellas
+(track_popularity > 70, playlist_genre = 'rock') se resuelven con un rango
+del índice ordenado en lugar de recorrer la tabla (ver filter).
+"""
+import os
+import sqlite3
+import threading
+import uuid
+from collections import defaultdict
+from contextlib import closing
+import numpy as np
+import pandas as pd
+
+TABLE = "rows"
+# Filas por executemany al importar un CSV grande.
+INSERT_BATCH = 10_000
+# Una columna de texto con hasta estos valores distintos se considera categórica.
+CATEGORICAL_MAX = 1000
+
+# Un lock por base: las escrituras sobre una misma tabla no se pisan.
+_locks = defaultdict(threading.RLock)
+
+
+def quote_identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _filterable(series):
+    """Columnas que vale la pena indexar para filtrar."""
+    if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return True
+    return series.nunique(dropna=True) <= CATEGORICAL_MAX
+
+
+def _native(value):
+    # SQLite no acepta tipos numpy; los NaN se guardan como NULL.
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+class MetadataStore:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = _locks[os.path.abspath(db_path)]
+
+    def exists(self):
+        return os.path.exists(self.db_path)
+
+    def _connect(self, readonly=True):
+        if readonly:
+            return sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        return sqlite3.connect(self.db_path)
+
+    def columns(self):
+        with closing(self._connect()) as conn:
+            return [row[1] for row in conn.execute(f"PRAGMA table_info({TABLE})")]
+
+    def replace(self, df):
+        """Reescribe la tabla completa; las filas quedan con rowid 0..n-1."""
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        # Nombre temporal único: dos escritores nunca comparten el archivo.
+        tmp_path = f"{self.db_path}.tmp-{uuid.uuid4().hex}"
+        try:
+            conn = sqlite3.connect(tmp_path)
+            try:
+                # Sin tipos declarados: cada valor conserva el tipo con que se insertó.
+                conn.execute(f"CREATE TABLE {TABLE} ({', '.join(quote_identifier(c) for c in df.columns)})")
+                self._insert(conn, df, list(df.columns), base=0)
+                # Los índices se crean después de insertar: es más rápido que mantenerlos.
+                for i, column in enumerate(df.columns):
+                    if _filterable(df[column]):
+                        conn.execute(f"CREATE INDEX idx_{i} ON {TABLE} ({quote_identifier(column)})")
+                conn.commit()
+            finally:
+                conn.close()
+            with self.lock:
+                os.replace(tmp_path, self.db_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def append(self, df, base):
+        """Agrega filas con rowid desde base; las columnas nuevas se ignoran."""
+        with self.lock:
+            conn = self._connect(readonly=False)
+            try:
+                columns = [row[1] for row in conn.execute(f"PRAGMA table_info({TABLE})")]
+                self._insert(conn, df.reindex(columns=columns), columns, base)
+                conn.commit()
+            finally:
+                conn.close()
+
+    @staticmethod
+    def _insert(conn, df, columns, base):
+        sql = (f"INSERT INTO {TABLE} (rowid, {', '.join(quote_identifier(c) for c in columns)}) "
+               f"VALUES ({', '.join('?' * (len(columns) + 1))})")
+        for start in range(0, len(df), INSERT_BATCH):
+            chunk = df.iloc[start:start + INSERT_BATCH]
+            rows = (
+                (base + start + i, *(_native(v) for v in values))
+                for i, values in enumerate(chunk.itertuples(index=False, name=None))
+            )
+            conn.executemany(sql, rows)
+
+    def import_csv(self, csv_path):
+        self.replace(pd.read_csv(csv_path))
+
+    def migrate_csv(self, csv_path):
+        """Importa el metadata.csv de una tabla antigua si todavía no hay base (una sola vez)."""
+        with self.lock:
+            if not self.exists() and os.path.exists(csv_path):
+                self.import_csv(csv_path)
+
+    def fetch(self, docs, fields):
+        """
+        {doc: {campo: valor}} para los doc ids globales pedidos. Los campos que
+        no existen en la tabla vuelven como "".
+        """
+        docs = [int(doc) for doc in docs]
+        if not docs:
+            return {}
+        with closing(self._connect()) as conn:
+            available = {row[1] for row in conn.execute(f"PRAGMA table_info({TABLE})")}
+            present = [f for f in fields if f in available]
+            select = ", ".join(["rowid"] + [quote_identifier(f) for f in present])
+            placeholders = ", ".join("?" * len(docs))
+            cursor = conn.execute(f"SELECT {select} FROM {TABLE} WHERE rowid IN ({placeholders})", docs)
+            found = {row[0]: dict(zip(present, row[1:])) for row in cursor}
+        return {
+            doc: {f: found[doc].get(f, "") for f in fields}
+            for doc in docs if doc in found
+        }
+
+    def filter(self, where, params=()):
+        """
+        Doc ids (ordenados, int64) de las filas que cumplen where, una
+        condición SQL con placeholders "?" y columnas entre comillas.
+        """
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(f"SELECT rowid FROM {TABLE} WHERE {where} ORDER BY rowid", params)
+            return np.fromiter((row[0] for row in cursor), dtype=np.int64)
@@ -0,0 +1,146 @@
+"""
+Instrumentación en proceso: histogramas de latencia por etapa expuestos en
+formato de texto de Prometheus (/metrics), y un escritor de logs de consultas
+que acumula filas en memoria y las escribe en CSV desde un hilo aparte.
+"""
+import bisect
+import csv
+import math
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+# Límites superiores (segundos) de los buckets, de 100 us a 10 s.
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def add_time(timings, stage, seconds):
+    """Suma seconds a timings[stage]; timings=None (no se mide) no hace nada."""
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+class Histogram:
+    def __init__(self, name, help_text, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        # valor de la etiqueta -> [conteos por bucket..., suma, total]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, seconds):
+        pos = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 2)
+            if pos < len(self.buckets):
+                series[pos] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for value, counts in sorted(series.items()):
+            label = f'{self.label}="{value}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {counts[-1]}')
+            lines.append(f"{self.name}_sum{{{label}}} {counts[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{label}}} {counts[-1]}")
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        self.stages = Histogram("search_stage_seconds", "Latencia de cada etapa de una consulta.", "stage")
+        self.requests = Histogram("request_seconds", "Latencia total por endpoint.", "endpoint")
+        # Funciones que devuelven {nombre: valor} y se exportan como gauges.
+        self._gauges = []
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.observe(name, time.perf_counter() - t0)
+
+    def observe_stages(self, timings):
+        """Registra un dict {etapa: segundos} medido por otro componente."""
+        for name, seconds in timings.items():
+            self.stages.observe(name, seconds)
+
+    def add_gauges(self, prefix, stats_fn):
+        self._gauges.append((prefix, stats_fn))
+
+    def render(self):
+        lines = self.stages.render() + self.requests.render()
+        for prefix, stats_fn in self._gauges:
+            for key, value in stats_fn().items():
+                if isinstance(value, (int, float)) and math.isfinite(value):
+                    lines.append(f"# TYPE {prefix}_{key} gauge")
+                    lines.append(f"{prefix}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class QueryLogWriter:
+    """
+    Log de consultas en CSV sin I/O en la request: log() sólo encola la fila
+    y un hilo la escribe por lotes cada flush_interval segundos. Si la cola
+    se llena las filas nuevas se descartan (y se cuentan en dropped).
+    """
+
+    def __init__(self, path, fieldnames, flush_interval=1.0, max_pending=10_000):
+        self.path = path
+        self.fieldnames = list(fieldnames)
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def log(self, row):
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self):
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                return rows
+
+    def flush(self):
+        rows = self._drain()
+        if not rows:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        file_exists = os.path.exists(self.path)
+        with open(self.path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=self.fieldnames, extrasaction="ignore")
+            if not file_exists:
+                writer.writeheader()
+            writer.writerows(rows)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from typing import List
+from pydantic import BaseModel, Field
 
 class SearchResponse(BaseModel):
     doc_id: str
@@ -7,3 +8,10 @@ class SearchResponse(BaseModel):
 class SQLQuery(BaseModel):
     query: str
 
+class BatchSearchQuery(BaseModel):
+    table: str
+    queries: List[str]
+    k: int = Field(5, ge=1)
+
+class SQLBatchQuery(BaseModel):
+    queries: List[str]
@@ -0,0 +1,162 @@
+"""
+Ejecución del WHERE de /search_sql sobre los índices de campo y la metadata.
+
+Cada LIKE se resuelve en el índice de su columna (data/<tabla>/fields/, ver
+utils.get_field_index_paths); un LIKE sobre una columna sin índice de texto
+es un error. Sólo las tablas antiguas, sin fields.json, resuelven todo LIKE
+en el índice principal. Las comparaciones con constantes se resuelven en
+SQLite con los índices de metadata_store y dan un conjunto de doc ids que se
+intersecta con los de texto antes de rankear. El puntaje es la suma del
+coseno de cada campo sobre sus propios términos.
+
+Si todo el texto cae en un mismo índice y no hay comparaciones, se usa
+directamente SPIMISearcher.search_plan (con poda MaxScore).
+"""
+import time
+import numpy as np
+from backend.indexing.search import SPIMISearcher
+from backend.indexing.query_plan import has_metadata, plan_columns
+from backend.metadata_store import quote_identifier
+from backend.metrics import add_time
+
+OPERATORS = {"eq": "=", "neq": "<>", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+
+def metadata_where(plan):
+    """(condición SQL, parámetros) de un plan hecho sólo de comparaciones."""
+    kind = plan[0]
+    if kind == "cmp":
+        _, op, column, value = plan
+        if op == "in":
+            return f"{quote_identifier(column)} IN ({', '.join('?' * len(value))})", list(value)
+        if op == "between":
+            return f"{quote_identifier(column)} BETWEEN ? AND ?", list(value)
+        return f"{quote_identifier(column)} {OPERATORS[op]} ?", [value]
+    parts = [metadata_where(child) for child in plan[1]]
+    joiner = " AND " if kind == "and" else " OR "
+    return joiner.join(f"({sql})" for sql, _ in parts), [p for _, params in parts for p in params]
+
+
+def _metadata_columns(plan):
+    if plan is None or plan[0] in ("terms", "phrase"):
+        return set()
+    if plan[0] == "cmp":
+        return {plan[2]}
+    return set().union(*(_metadata_columns(child) for child in plan[1]))
+
+
+class TableSearch:
+    """
+    Una consulta (o un lote) sobre una tabla. Los buscadores de cada campo se
+    abren con open_index (p. ej. IndexRegistry.get) sólo si el plan los usa,
+    y sus búsquedas en el diccionario y postings decodificados se comparten
+    entre las consultas hechas con la misma instancia. Cada buscador queda
+    fijo desde su primer uso: esas caches dependen de los segmentos con que se
+    abrió, y un merge en segundo plano puede cambiar el manifiesto a mitad de
+    un lote.
+    """
+
+    def __init__(self, index_path, field_paths, store, open_index):
+        self.index_path = index_path
+        self.field_paths = field_paths
+        self.store = store
+        self.open_index = open_index
+        self._caches = {}
+
+    def _path(self, column):
+        return self.field_paths.get(column, self.index_path)
+
+    def _check_columns(self, plan):
+        """ValueError si el plan usa columnas que no existen en la tabla."""
+        # Sin fields.json (tabla antigua) todo LIKE va al índice principal,
+        # igual que un LIKE que no nombra una columna.
+        if self.field_paths:
+            unindexed = plan_columns(plan) - set(self.field_paths) - {None}
+            if unindexed:
+                raise ValueError(f"Columnas sin índice de texto: {', '.join(sorted(unindexed))}")
+        missing = _metadata_columns(plan) - set(self.store.columns())
+        if missing:
+            raise ValueError(f"Columnas inexistentes: {', '.join(sorted(missing))}")
+
+    def _searcher(self, path):
+        if path not in self._caches:
+            searcher = self.open_index(path)
+            self._caches[path] = (searcher, {}, [{} for _ in searcher.segments])
+        return self._caches[path]
+
+    def search(self, plan, top_k, timings=None):
+        """[(doc id global, score)] de mayor a menor puntaje."""
+        self._check_columns(plan)
+        paths = {self._path(column) for column in plan_columns(plan)}
+        if not has_metadata(plan) and len(paths) <= 1:
+            searcher, term_info, postings = self._searcher(paths.pop() if paths else self.index_path)
+            return searcher.search_plan(plan, top_k, term_info, postings, timings)
+
+        if top_k <= 0:
+            return []
+        docs = self._candidates(plan, timings)
+        if len(docs) == 0:
+            return []
+
+        scores = np.zeros(len(docs), dtype=np.float64)
+        for path, tokens in self._tokens_by_path(plan).items():
+            searcher, term_info, postings = self._searcher(path)
+            scores += searcher.score_docs(tokens, docs, term_info, postings, timings)
+
+        # Mayor puntaje primero y, a igual puntaje, el doc id menor.
+        if len(docs) > top_k:
+            kth = np.partition(scores, -top_k)[-top_k]
+            keep = scores >= kth
+            docs, scores = docs[keep], scores[keep]
+        order = np.lexsort((docs, -scores))[:top_k]
+        return [(int(docs[i]), float(scores[i])) for i in order]
+
+    def _tokens_by_path(self, plan, out=None):
+        out = {} if out is None else out
+        if plan[0] in ("terms", "phrase"):
+            out.setdefault(self._path(plan[1]), []).extend(plan[2])
+        elif plan[0] != "cmp":
+            for child in plan[1]:
+                self._tokens_by_path(child, out)
+        return out
+
+    def _candidates(self, plan, timings):
+        """Doc ids globales (ordenados) que cumplen el plan."""
+        if not has_metadata(plan):
+            paths = {self._path(column) for column in plan_columns(plan)}
+            if len(paths) == 1:
+                searcher, term_info, postings = self._searcher(paths.pop())
+                return searcher.candidate_docs(plan, term_info, postings, timings)
+        elif not plan_columns(plan):
+            # Sólo comparaciones: una única consulta a SQLite.
+            t0 = time.perf_counter()
+            docs = self.store.filter(*metadata_where(plan))
+            add_time(timings, "metadata_filter", time.perf_counter() - t0)
+            return docs
+
+        if plan[0] == "or":
+            return np.unique(np.concatenate([self._candidates(child, timings) for child in plan[1]]))
+
+        # AND: las comparaciones van juntas en una sola consulta a SQLite y los
+        # LIKE de un mismo índice se intersectan dentro de él.
+        groups = {}
+        for child in plan[1]:
+            if not plan_columns(child):
+                key = "metadata"
+            elif not has_metadata(child) and len({self._path(c) for c in plan_columns(child)}) == 1:
+                key = self._path(next(iter(plan_columns(child))))
+            else:
+                key = len(groups)
+            groups.setdefault(key, []).append(child)
+        children = [
+            self._candidates(group[0] if len(group) == 1 else ("and", tuple(group)), timings)
+            for group in groups.values()
+        ]
+        # De la lista más corta a la más larga.
+        children.sort(key=len)
+        result = children[0]
+        for docs in children[1:]:
+            if len(result) == 0:
+                break
+            result = SPIMISearcher._intersect(result, docs)
+        return result
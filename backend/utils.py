@@ -1,5 +1,12 @@
 import pandas as pd
+import json
 import os
+import re
+import shutil
+import threading
+from collections import defaultdict
+from backend.indexing.table_index import TableIndex
+from backend.metadata_store import MetadataStore
 
 AUDIO_DIR = "multimedia/songs"
 
@@ -10,6 +17,88 @@ def get_audio_files():
             doc_id = fname.split(".")[0]
             audio_files[doc_id] = os.path.join(AUDIO_DIR, fname)
     return audio_files
+
+# Tablas cuyo index.json antiguo ya se verificó en este proceso.
+_migrated_tables = set()
+
+def get_index_table(table: str, n_workers: int = 1, positions: bool = False) -> TableIndex:
+    return TableIndex(f"data/{table}/index", n_workers=n_workers, positions=positions)
+
+def get_index_path(table: str) -> str:
+    """Ruta del manifest del índice de la tabla; migra el index.json antiguo si es necesario."""
+    table_index = get_index_table(table)
+    legacy_path = f"data/{table}/index.json"
+    if table not in _migrated_tables and os.path.exists(legacy_path):
+        if not table_index.is_current():
+            table_index.import_json(legacy_path)
+        _migrated_tables.add(table)
+    return table_index.manifest_path
+
+# Un lock por tabla: las cargas de /insert_csv escriben metadata.csv, SQLite y
+# los índices con los mismos doc ids, así que no pueden intercalarse.
+_table_locks = defaultdict(threading.Lock)
+
+def table_lock(table: str) -> threading.Lock:
+    return _table_locks[table]
+
+def load_fields(table: str) -> dict:
+    """
+    data/<tabla>/fields.json: {"text_column": columna del índice principal,
+    "fields": {columna: directorio de su índice}}. Vacío en tablas antiguas.
+    """
+    try:
+        with open(f"data/{table}/fields.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"text_column": None, "fields": {}}
+
+def save_fields(table: str, text_column: str, fields: dict):
+    path = f"data/{table}/fields.json"
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"text_column": text_column, "fields": fields}, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def field_index_dir(table: str, column: str, position: int) -> str:
+    """Directorio del índice de una columna (el nombre puede tener cualquier carácter)."""
+    return f"data/{table}/fields/{position}_{re.sub(r'[^0-9A-Za-z_-]', '_', column)}"
+
+def remove_unused_field_dirs(table: str, keep):
+    """Borra los índices de data/<tabla>/fields/ que ya no figuran en fields.json."""
+    fields_dir = f"data/{table}/fields"
+    if not os.path.isdir(fields_dir):
+        return
+    keep = {os.path.abspath(d) for d in keep}
+    for name in os.listdir(fields_dir):
+        path = os.path.join(fields_dir, name)
+        if os.path.abspath(path) not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+def get_field_index_paths(table: str) -> dict:
+    """{columna: manifest de su índice}; la columna de texto principal usa el índice de la tabla."""
+    info = load_fields(table)
+    paths = {column: TableIndex(index_dir).manifest_path for column, index_dir in info["fields"].items()}
+    if info["text_column"] is not None:
+        paths[info["text_column"]] = get_index_path(table)
+    return paths
+
+def get_metadata_store(table: str, migrate: bool = False) -> MetadataStore:
+    """
+    Metadata de la tabla. Las consultas no escriben en disco: el metadata.csv
+    de las tablas antiguas se importa al arrancar (migrate_metadata_stores)
+    o, con migrate=True, al cargar datos.
+    """
+    store = MetadataStore(f"data/{table}/metadata.db")
+    if migrate:
+        store.migrate_csv(f"data/{table}/metadata.csv")
+    return store
+
+def migrate_metadata_stores(data_dir: str = "data"):
+    """Crea metadata.db para cada tabla que sólo tiene el metadata.csv antiguo."""
+    if not os.path.isdir(data_dir):
+        return
+    for table in sorted(os.listdir(data_dir)):
+        if os.path.exists(os.path.join(data_dir, table, "metadata.csv")):
+            get_metadata_store(table, migrate=True)
     
 def ensure_identifier_column(df: pd.DataFrame, preferred: str = None) -> tuple[pd.DataFrame, str]:
     if preferred and preferred in df.columns:
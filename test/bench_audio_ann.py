@@ -0,0 +1,64 @@
+import sys
+import time
+import numpy as np
+from backend.audio_indexer import AudioIndexer
+
+# Uso: python -m test.bench_audio_ann [tamaños separados por coma]
+# Catálogos sintéticos de histogramas BoAW: cada "género" es una distribución
+# sobre los codewords y cada canción mezcla un género con ruido.
+N_CLUSTERS = 128
+N_GENRES = 200
+FRAMES = 2000
+N_QUERIES = 200
+K = 10
+SETTINGS = [(64, 4), (64, 8), (64, 16)]  # (n_lists, n_probe)
+
+
+def synthetic_histograms(n, rng, genres):
+    genre = rng.integers(0, len(genres), size=n)
+    noise = rng.dirichlet(np.full(N_CLUSTERS, 0.5), size=n)
+    mix = 0.5 * genres[genre] + 0.5 * noise
+    return np.array([rng.multinomial(FRAMES, p) for p in mix])
+
+
+def percentiles(times):
+    ms = np.array(times) * 1000
+    return np.percentile(ms, 50), np.percentile(ms, 99)
+
+
+def bench(n_docs, rng, genres):
+    indexer = AudioIndexer(n_clusters=N_CLUSTERS)
+    indexer.doc_ids = [str(i) for i in range(n_docs)]
+    indexer.tfidf_matrix = indexer.tfidf_transformer.fit_transform(synthetic_histograms(n_docs, rng, genres)).tocsr()
+    indexer.idf = indexer.tfidf_transformer.idf_
+    indexer._build_postings()
+    queries = synthetic_histograms(N_QUERIES, rng, genres)
+
+    exact, exact_times = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        exact.append({doc for doc, _ in indexer.knn_secuencial(q, K)})
+        exact_times.append(time.perf_counter() - t0)
+    p50, p99 = percentiles(exact_times)
+    print(f"{n_docs:>8} {'exacto':<14} {1.0:>9.3f} {p50:>9.2f} {p99:>9.2f}")
+
+    for n_lists, n_probe in SETTINGS:
+        indexer.build_ann(n_lists=n_lists, n_probe=n_probe)
+        recall, times = [], []
+        for q, truth in zip(queries, exact):
+            t0 = time.perf_counter()
+            found = {doc for doc, _ in indexer.knn_ann(q, K)}
+            times.append(time.perf_counter() - t0)
+            recall.append(len(found & truth) / K)
+        p50, p99 = percentiles(times)
+        name = f"ivf {n_lists}/{n_probe}"
+        print(f"{n_docs:>8} {name:<14} {np.mean(recall):>9.3f} {p50:>9.2f} {p99:>9.2f}")
+
+
+if __name__ == "__main__":
+    sizes = [int(n) for n in sys.argv[1].split(",")] if len(sys.argv) > 1 else [1000, 10000, 50000]
+    rng = np.random.default_rng(0)
+    genres = rng.dirichlet(np.full(N_CLUSTERS, 0.3), size=N_GENRES)
+    print(f"{'docs':>8} {'método':<14} {'recall@' + str(K):>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for n_docs in sizes:
+        bench(n_docs, rng, genres)
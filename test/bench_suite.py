@@ -0,0 +1,316 @@
+"""
+Benchmark reproducible de indexación y consultas (texto y audio).
+
+Uso:
+    python -m test.bench_suite [--tables spotify_3k,top_10k_songs,spotify_32k]
+                               [--synthetic 100000,1000000] [--audio 1000,10000]
+                               [--queries 200] [--out analisis/bench/<commit>.json]
+
+Por cada corpus de texto mide: construcción con SPIMIIndexer (tiempo y pico
+de RSS, en un proceso aparte), tamaño en disco, tiempo de apertura de
+SPIMISearcher y latencia p50/p95/p99 de SPIMISearcher.search y de
+/search_sql (sin cache de resultados). Los documentos de las tablas salen de
+la columna de texto de data/<tabla>/metadata.csv, así que no hace falta el
+CSV original. Si la tabla no tiene metadata.csv (o no coincide con el
+índice) se reconstruyen desde los términos del índice, cada uno repetido tf
+veces: esos términos ya están preprocesados y SPIMIIndexer los vuelve a
+procesar, así que el corpus no es el original (el JSON lo indica en
+"documents"). El corpus sintético sigue una ley de Zipf.
+Para audio usa catálogos BoAW sintéticos (ver test/bench_audio_ann.py) y
+mide lo mismo: construcción (tiempo y pico de RSS, en un proceso aparte),
+tamaño, apertura y latencia de knn_secuencial, knn_invertido y knn_ann. El resultado es un JSON para comparar entre commits.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from backend.audio_indexer import AudioIndexer, peak_rss_mb
+from backend.indexing.search import SPIMISearcher
+from backend.indexing.spimi import SPIMIIndexer
+from backend.utils import detect_text_column, get_index_path, load_fields
+from test.bench_audio_ann import N_CLUSTERS, N_GENRES, synthetic_histograms
+
+FIXED_QUERIES = ["love", "love baby", "i will always love you", "the night is young", "dance with me"]
+K = 10
+OPEN_REPEAT = 5
+SYNTHETIC_VOCAB = 50_000
+SYNTHETIC_DOC_LEN = 120
+
+
+def latency_stats(times):
+    ms = np.array(times) * 1000
+    return {
+        "n": len(ms),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def table_text_column(table):
+    """
+    Columna de metadata.csv que se indexó (la de fields.json o, en tablas
+    antiguas, la que elige detect_text_column), o None si no hay metadata.csv
+    con una fila por documento del índice.
+    """
+    path = f"data/{table}/metadata.csv"
+    if not os.path.exists(path):
+        return None
+    df = pd.read_csv(path)
+    if len(df) != SPIMISearcher(get_index_path(table)).n_docs:
+        return None
+    column = load_fields(table)["text_column"]
+    if column in df.columns:
+        return column
+    try:
+        return detect_text_column(df)
+    except ValueError:
+        return None
+
+
+def table_documents(table):
+    """Documentos de la tabla, {doc: texto}: su columna de texto o, si no hay, los términos del índice."""
+    column = table_text_column(table)
+    if column is not None:
+        texts = pd.read_csv(f"data/{table}/metadata.csv", usecols=[column])[column]
+        return dict(enumerate(texts.fillna("").astype(str)))
+    searcher = SPIMISearcher(get_index_path(table))
+    tokens = [[] for _ in range(searcher.n_docs)]
+    for base, segment in searcher.segments:
+        for term, i in segment.iter_terms():
+            term = term.decode("utf-8") if isinstance(term, bytes) else term
+            docs, tfs = segment.postings_at(i)
+            for doc, tf in zip(docs.tolist(), tfs.tolist()):
+                tokens[base + doc].extend([term] * tf)
+    return {searcher.doc_id(d): " ".join(words) for d, words in enumerate(tokens)}
+
+
+def synthetic_documents(n_docs, seed=0):
+    rng = np.random.default_rng(seed)
+    vocab = [f"w{i}" for i in range(SYNTHETIC_VOCAB)]
+    # Frecuencias de Zipf truncadas al vocabulario.
+    weights = 1.0 / np.arange(1, SYNTHETIC_VOCAB + 1)
+    weights /= weights.sum()
+    docs = {}
+    for doc in range(n_docs):
+        words = rng.choice(SYNTHETIC_VOCAB, size=SYNTHETIC_DOC_LEN, p=weights)
+        docs[str(doc)] = " ".join(vocab[w] for w in words)
+    return docs
+
+
+def _build(loader, arg, output_path):
+    # Corre en un proceso aparte para que el pico de RSS sea sólo el de
+    # cargar los documentos y construir el índice.
+    documents = loader(arg)
+    t0 = time.perf_counter()
+    SPIMIIndexer(output_path).index_documents(documents)
+    return len(documents), time.perf_counter() - t0, peak_rss_mb()
+
+
+def query_set(searcher, n_queries, seed=0):
+    """Consultas fijas más términos del diccionario elegidos con semilla fija."""
+    segment = searcher.segments[0][1]
+    rng = random.Random(seed)
+    terms = [segment.term(rng.randrange(segment.n_terms)) for _ in range(4 * n_queries)]
+    terms = [t.decode("utf-8") if isinstance(t, bytes) else t for t in terms]
+    queries = list(FIXED_QUERIES)
+    while len(queries) < n_queries:
+        queries.append(" ".join(rng.sample(terms, rng.randint(1, 4))))
+    return queries
+
+
+def sql_client():
+    """
+    TestClient de la API sin cache de resultados ni log de consultas (el
+    benchmark no agrega filas a analisis/log.csv), o None si no se puede importar.
+    """
+    try:
+        from fastapi.testclient import TestClient
+        import backend.main as main
+        from backend.indexing.result_cache import ResultCache
+    except Exception as e:
+        print(f"⚠️ /search_sql no se mide: {e}")
+        return None, None
+    main.results_cache = ResultCache(max_bytes=0)
+    main.query_log = None
+    return TestClient(main.app), main
+
+
+def bench_sql(client, table, queries):
+    """
+    Latencia de /search_sql con LIKE sobre la columna de texto de la tabla
+    (las tablas antiguas, sin fields.json, aceptan cualquier columna). Una
+    respuesta que no sea 200 se reporta como error en vez de medirse.
+    """
+    column = load_fields(table)["text_column"] or "text"
+    sql_times = []
+    for q in queries:
+        pattern = q.replace("'", "''")
+        sql = f"SELECT id FROM {table} WHERE {column} LIKE '{pattern}' LIMIT {K}"
+        t0 = time.perf_counter()
+        response = client.post("/search_sql", json={"query": sql})
+        sql_times.append(time.perf_counter() - t0)
+        if response.status_code != 200:
+            error = f"HTTP {response.status_code}: {response.text}"
+            print(f"⚠️ /search_sql falló en {table}: {error}")
+            return {"error": error, "query": sql}
+    return latency_stats(sql_times)
+
+
+def bench_text(name, loader, arg, n_queries, table=None, client=None):
+    print(f"📚 {name}")
+    tmp_dir = tempfile.mkdtemp(prefix="bench_")
+    try:
+        index_path = os.path.join(tmp_dir, "index.bin")
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            n_docs, build_s, build_rss = pool.submit(_build, loader, arg, index_path).result()
+
+        open_times = []
+        for _ in range(OPEN_REPEAT):
+            t0 = time.perf_counter()
+            searcher = SPIMISearcher(index_path)
+            open_times.append(time.perf_counter() - t0)
+
+        queries = query_set(searcher, n_queries)
+        search_times = []
+        for q in queries:
+            t0 = time.perf_counter()
+            searcher.search(q, top_k=K)
+            search_times.append(time.perf_counter() - t0)
+
+        result = {
+            "corpus": name,
+            "n_docs": n_docs,
+            "build_s": round(build_s, 3),
+            "build_peak_rss_mb": build_rss,
+            "index_bytes": os.path.getsize(index_path),
+            "open_ms": round(float(np.median(open_times)) * 1000, 3),
+            "search": latency_stats(search_times),
+        }
+
+        if table is not None and client is not None:
+            result["search_sql"] = bench_sql(client, table, queries)
+        return result
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def audio_corpus(n_docs, n_queries, seed=0):
+    """(histogramas del catálogo, histogramas de consulta) con semilla fija."""
+    rng = np.random.default_rng(seed)
+    genres = rng.dirichlet(np.full(N_CLUSTERS, 0.3), size=N_GENRES)
+    histograms = synthetic_histograms(n_docs, rng, genres)
+    return histograms, synthetic_histograms(n_queries, rng, genres)
+
+
+def _build_audio(n_docs, n_queries, seed, output_path):
+    # Igual que _build: en un proceso aparte para medir el pico de RSS.
+    histograms, _ = audio_corpus(n_docs, n_queries, seed)
+    t0 = time.perf_counter()
+    indexer = AudioIndexer(n_clusters=N_CLUSTERS)
+    indexer.centroids = np.zeros((N_CLUSTERS, indexer.n_mfcc), dtype=np.float32)
+    indexer.doc_ids = [str(i) for i in range(n_docs)]
+    indexer.tfidf_matrix = indexer.tfidf_transformer.fit_transform(histograms).tocsr()
+    indexer.idf = indexer.tfidf_transformer.idf_
+    indexer._build_postings()
+    indexer.build_ann()
+    build_s = time.perf_counter() - t0
+    indexer.save(output_path)
+    return build_s, peak_rss_mb()
+
+
+def bench_audio(n_docs, n_queries, seed=0):
+    print(f"🎵 audio sintético: {n_docs} documentos")
+    _, queries = audio_corpus(n_docs, n_queries, seed)
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_audio_")
+    try:
+        path = os.path.join(tmp_dir, "audio_index")
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            build_s, build_rss = pool.submit(_build_audio, n_docs, n_queries, seed, path).result()
+        open_times = []
+        for _ in range(OPEN_REPEAT):
+            t0 = time.perf_counter()
+            opened = AudioIndexer.from_file(path)
+            open_times.append(time.perf_counter() - t0)
+
+        result = {
+            "corpus": f"audio_synthetic_{n_docs}",
+            "n_docs": n_docs,
+            "build_s": round(build_s, 3),
+            "build_peak_rss_mb": build_rss,
+            "index_bytes": sum(
+                os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files
+            ),
+            "open_ms": round(float(np.median(open_times)) * 1000, 3),
+        }
+        for method in ("knn_secuencial", "knn_invertido", "knn_ann"):
+            search = getattr(opened, method)
+            times = []
+            for q in queries:
+                t0 = time.perf_counter()
+                search(q, K)
+                times.append(time.perf_counter() - t0)
+            result[method] = latency_stats(times)
+        return result
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def parse_sizes(value):
+    return [int(n) for n in value.split(",") if n]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tables", default="spotify_3k,top_10k_songs,spotify_32k")
+    parser.add_argument("--synthetic", type=parse_sizes, default=[100_000, 1_000_000])
+    parser.add_argument("--audio", type=parse_sizes, default=[1_000, 10_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    commit = git_commit()
+    client, _ = sql_client()
+    report = {
+        "commit": commit,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "k": K,
+        "text": [],
+        "audio": [],
+    }
+
+    for table in [t for t in args.tables.split(",") if t]:
+        result = bench_text(table, table_documents, table, args.queries, table, client)
+        column = table_text_column(table)
+        # "index_terms": corpus reconstruido con términos ya preprocesados.
+        result["documents"] = f"metadata.csv:{column}" if column is not None else "index_terms"
+        report["text"].append(result)
+    for n_docs in args.synthetic:
+        report["text"].append(bench_text(f"synthetic_{n_docs}", synthetic_documents, n_docs, args.queries))
+    for n_docs in args.audio:
+        report["audio"].append(bench_audio(n_docs, args.queries))
+
+    out = args.out or f"analisis/bench/{commit}.json"
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Resultados guardados en {out}")
@@ -1,11 +1,20 @@
 # build_audio_index.py
 import os
 from backend.audio_indexer import AudioIndexer
+from backend.feature_cache import FeatureCache
 import time
 
 AUDIO_DIR = "multimedia/songs"
-INDEX_PATH = "multimedia/audio_index.pkl"
+INDEX_PATH = "multimedia/audio_index"
 N_CLUSTERS = 128
+FEATURES_DIR = "multimedia/features"
+# Memoria máxima de la muestra de frames para entrenar el diccionario.
+CODEBOOK_MEMORY_MB = 256
+# Procesos para decodificar y extraer MFCC en paralelo.
+N_WORKERS = os.cpu_count() or 1
+# Listas del índice IVF y cuántas se recorren por consulta.
+ANN_LISTS = 64
+ANN_PROBE = 8
 
 def get_audio_files():
     audio_files = {}
@@ -18,18 +27,24 @@ def get_audio_files():
 if __name__ == "__main__":
     print("🔁 Construyendo índice acústico...")
 
-    indexer = AudioIndexer(n_clusters=N_CLUSTERS)
+    indexer = AudioIndexer(n_clusters=N_CLUSTERS, feature_cache=FeatureCache(FEATURES_DIR),
+                           n_workers=N_WORKERS)
     audio_files = get_audio_files()
 
     t0 = time.time()
     print("📊 Entrenando diccionario acústico (KMeans)...")
-    indexer.fit_dictionary(audio_files.values())
+    indexer.fit_dictionary_streaming(audio_files.values(), memory_mb=CODEBOOK_MEMORY_MB)
     t_inv = round((time.time() - t0) * 1000, 2)
     print(f"diccionario acustico entrenado en {t_inv} ms")
 
     print("📚 Construyendo BoAW + TF-IDF...")
     indexer.build_bow(audio_files)
 
+    print("🧭 Construyendo índice aproximado (IVF)...")
+    indexer.build_ann(n_lists=ANN_LISTS, n_probe=ANN_PROBE)
+    cache = indexer.feature_cache
+    print(f"Cache de MFCC: {cache.hits} aciertos, {cache.misses} extracciones")
+
     print(f"💾 Guardando índice en {INDEX_PATH}")
     indexer.save(INDEX_PATH)
     print("✅ Índice construido y guardado correctamente.")
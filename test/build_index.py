@@ -1,18 +1,30 @@
 import csv
-from backend.indexing.spimi import SPIMIIndexer
+from backend.indexing.table_index import TableIndex
+from backend.utils import field_index_dir, get_index_table, get_metadata_store, save_fields
 
-def load_documents_from_csv(csv_path):
+TABLE = "Audio"
+TEXT_COLUMN = "lyrics"
+# Columnas de texto con índice propio; las numéricas (danceability, tempo...)
+# se filtran desde la metadata y no se indexan como texto.
+FIELDS = ["track_name", "track_artist", "track_album_name", "playlist_name", "playlist_genre", "playlist_subgenre"]
+# Posiciones de los términos de las letras, para buscar frases.
+POSITIONS = True
+
+def load_documents_from_csv(csv_path, column):
     docs = {}
     with open(csv_path, newline='', encoding='utf-8') as csvfile:
         reader = csv.DictReader(csvfile)
-        for row in reader:
-            text = f"{row['track_id']} {row['track_name']} {row['track_artist']} {row['lyrics']} {row['track_popularity']} {row['track_album_id']} {row['track_album_name']} {row['track_album_release_date']} {row['playlist_name']} {row['playlist_id']} {row['playlist_genre']} {row['playlist_subgenre']} {row['danceability']} {row['energy']} {row['key']} {row['loudness']} {row['mode']} {row['speechiness']} {row['acousticness']} {row['instrumentalness']} {row['liveness']} {row['valence']} {row['tempo']} {row['duration_ms']} {row['language']}"
-            docs[row['track_id']] = text
+        for i, row in enumerate(reader):
+            docs[i] = row[column] or ""
     return docs
 
 if __name__ == "__main__":
     csv_path = "test/spotify_songs.csv"
-    docs = load_documents_from_csv(csv_path)
-    indexer = SPIMIIndexer(output_path="data/Audio/index.json")
-    indexer.index_documents(docs)
-    print("✔ Índice invertido construido y guardado en data/index.json")
+    get_index_table(TABLE, positions=POSITIONS).replace(load_documents_from_csv(csv_path, TEXT_COLUMN))
+    field_dirs = {}
+    for i, column in enumerate(FIELDS):
+        field_dirs[column] = field_index_dir(TABLE, column, i)
+        TableIndex(field_dirs[column]).replace(load_documents_from_csv(csv_path, column))
+    save_fields(TABLE, TEXT_COLUMN, field_dirs)
+    get_metadata_store(TABLE, migrate=False).import_csv(csv_path)
+    print(f"✔ Índices de {TEXT_COLUMN} y {', '.join(FIELDS)} construidos en data/{TABLE}/")
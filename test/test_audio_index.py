@@ -3,7 +3,7 @@ from backend.audio_indexer import AudioIndexer
 
 AUDIO_DIR = "test/audio" # ruta de los audios de prueba
 QUERY_AUDIO = "test/query_audio.mp3"  # archivo para buscar similares
-INDEX_PATH = "multimedia/audio_index_prueba.pkl"
+INDEX_PATH = "multimedia/audio_index_prueba"
 N_CLUSTERS = 128
 
 # 1. Construcción del diccionario acústico
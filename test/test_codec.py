@@ -0,0 +1,74 @@
+import os
+import tempfile
+import numpy as np
+from backend.indexing.codec import (
+    vbyte_encode, vbyte_decode, encode_postings, decode_postings, encode_positions, decode_positions,
+)
+from backend.indexing.segment import SegmentWriter, SegmentReader
+
+# Uso: python -m test.test_codec
+SEED = 0
+N_LISTS = 200
+
+
+def random_postings(rng, n_docs=100_000):
+    """Doc ids crecientes, TF y posiciones crecientes dentro de cada documento."""
+    df = int(rng.integers(1, 2000))
+    docs = np.sort(rng.choice(n_docs, size=df, replace=False)).astype(np.int32)
+    tfs = rng.integers(1, 20, size=df).astype(np.int32)
+    positions = np.concatenate([np.sort(rng.choice(5000, size=tf, replace=False)) for tf in tfs])
+    return docs, tfs, positions
+
+
+def check(name, ok):
+    print(f"  {'✅' if ok else '❌'} {name}")
+    return ok
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(SEED)
+    ok = True
+
+    print("🔁 VByte")
+    # Bordes de cada cantidad de bytes, hasta el máximo de 32 bits.
+    edges = np.array([0, 1, 127, 128, 16383, 16384, 2 ** 21 - 1, 2 ** 21, 2 ** 28, 2 ** 32 - 1], dtype=np.int64)
+    ok &= check("bordes de 1 a 5 bytes", np.array_equal(vbyte_decode(vbyte_encode(edges)), edges))
+    ok &= check("lista vacía", len(vbyte_decode(vbyte_encode([]))) == 0)
+    small = rng.integers(0, 128, size=1000)
+    ok &= check("todos de un byte", np.array_equal(vbyte_decode(vbyte_encode(small)), small))
+    values = rng.integers(0, 2 ** 32, size=10_000)
+    ok &= check("enteros aleatorios de 32 bits", np.array_equal(vbyte_decode(vbyte_encode(values)), values))
+
+    print("🔁 Postings y posiciones")
+    postings_ok = positions_ok = True
+    for _ in range(N_LISTS):
+        docs, tfs, positions = random_postings(rng)
+        got_docs, got_tfs = decode_postings(encode_postings(docs, tfs), len(docs))
+        postings_ok &= np.array_equal(got_docs, docs) and np.array_equal(got_tfs, tfs)
+        positions_ok &= np.array_equal(decode_positions(encode_positions(positions, tfs), tfs), positions)
+    ok &= check(f"{N_LISTS} listas de postings", postings_ok)
+    ok &= check(f"{N_LISTS} listas de posiciones", positions_ok)
+
+    print("🔁 Segmento")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "seg.bin")
+        terms = sorted(f"t{i:04d}" for i in range(N_LISTS))
+        lists = [random_postings(rng, n_docs=3000) for _ in terms]
+        with SegmentWriter(path, [f"d{i}" for i in range(3000)], positions=True) as writer:
+            for term, (docs, tfs, positions) in zip(terms, lists):
+                writer.add_term(term, docs, tfs, positions)
+            writer.set_norms(np.ones(3000))
+        reader = SegmentReader(path)
+        segment_ok = reader.has_positions and reader.n_terms == len(terms)
+        for term, (docs, tfs, positions) in zip(terms, lists):
+            i = reader.find(term)
+            got_docs, got_tfs = reader.postings_at(i)
+            segment_ok &= np.array_equal(got_docs, docs) and np.array_equal(got_tfs, tfs)
+            segment_ok &= np.array_equal(reader.positions_at(i, got_tfs), positions)
+        ok &= check("escritura y lectura con posiciones", segment_ok)
+        ok &= check("término inexistente", reader.find("zzz") == -1)
+        reader.close()
+
+    if not ok:
+        raise SystemExit("❌ Hay diferencias en el codec.")
+    print("✔ Codec correcto.")
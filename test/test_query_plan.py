@@ -0,0 +1,124 @@
+import os
+import random
+import re
+import tempfile
+from backend.ai_query_parser import parse_sql_query
+from backend.indexing.preprocessor import get_stop_words, preprocess, stem, tokenize
+from backend.indexing.query_plan import tokenize_plan
+from backend.indexing.search import SPIMISearcher
+from test.test_text_search import (
+    N_DOCS, PHRASES, SEED, WORDS, Exhaustive, build_table, check, same_ranking, synthetic_lyrics,
+)
+
+# Uso: python -m test.test_query_plan
+# Compara los planes booleanos de /search_sql (AND/OR, frases y proximidad)
+# con una evaluación por fuerza bruta sobre el texto de cada documento.
+N_QUERIES = 300
+TOP_K = 10
+_phrase = re.compile(r'^"(.*)"(?:~(\d+))?$')
+
+
+class BruteForce:
+    """Evalúa el WHERE de parse_sql_query directamente sobre los textos."""
+
+    def __init__(self, docs, exhaustive):
+        stop_words = get_stop_words()
+        # Palabra de cada posición: stem si es de contenido, tal cual si es stopword.
+        self.words = [[w if w in stop_words else stem(w) for w in tokenize(text)] for text in docs.values()]
+        self.stop_words = stop_words
+        self.exhaustive = exhaustive
+
+    def _phrase_docs(self, text, slop):
+        pattern = [w if w in self.stop_words else stem(w) for w in tokenize(text)]
+        if slop is None:
+            n = len(pattern)
+            return {doc for doc, words in enumerate(self.words)
+                    if any(words[i:i + n] == pattern for i in range(len(words) - n + 1))}
+        # Proximidad: cada término de contenido a lo sumo a slop palabras de
+        # alguna aparición del primero (las stopwords no cuentan).
+        content = [w for w in tokenize(text) if w not in self.stop_words]
+        first, rest = stem(content[0]), [stem(w) for w in content[1:]]
+        found = set()
+        for doc, words in enumerate(self.words):
+            where = {}
+            for position, word in enumerate(words):
+                where.setdefault(word, []).append(position)
+            for anchor in where.get(first, []):
+                if all(any(abs(p - anchor) <= slop and (term != first or p != anchor) for p in where.get(term, []))
+                       for term in rest):
+                    found.add(doc)
+                    break
+        return found
+
+    def candidates(self, plan):
+        if plan[0] == "like":
+            match = _phrase.match(plan[2])
+            if match is None:
+                return set().union(*(self.exhaustive.docs_with(t) for t in preprocess(plan[2])))
+            slop = int(match.group(2)) if match.group(2) is not None else None
+            return self._phrase_docs(match.group(1), slop)
+        children = [self.candidates(child) for child in plan[1]]
+        return set.intersection(*children) if plan[0] == "and" else set.union(*children)
+
+    def tokens(self, plan):
+        if plan[0] == "like":
+            match = _phrase.match(plan[2])
+            return preprocess(match.group(1) if match else plan[2])
+        return [token for child in plan[1] for token in self.tokens(child)]
+
+    def search(self, plan, k):
+        scores = self.exhaustive.scores(self.tokens(plan), self.candidates(plan))
+        return scores, sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+
+def random_where(rng):
+    a, b, c = rng.sample(WORDS, 3)
+    phrase = rng.choice(PHRASES)
+    near = " ".join(rng.sample(WORDS, 2))
+    return rng.choice([
+        f"lyrics LIKE '{a}' AND lyrics LIKE '{b}'",
+        f"lyrics LIKE '{a} {c}' AND lyrics LIKE '{b}'",
+        f"lyrics LIKE '{a}' AND (lyrics LIKE '{b}' OR lyrics LIKE '{c}')",
+        f"(lyrics LIKE '{a}' AND lyrics LIKE '{b}') OR lyrics LIKE '{c}'",
+        f"lyrics LIKE '{a}' AND lyrics LIKE 'zzqxj'",
+        f"lyrics LIKE '\"{phrase}\"'",
+        f"lyrics LIKE '\"{phrase}\"' AND lyrics LIKE '{a}'",
+        f"lyrics LIKE '\"{phrase}\"' OR lyrics LIKE '\"{near}\"~3'",
+        f"lyrics LIKE '\"{near}\"~{rng.randint(0, 6)}'",
+        f"lyrics LIKE '\"{a} {a}\"~2' AND lyrics LIKE '{b}'",
+    ])
+
+
+if __name__ == "__main__":
+    rng = random.Random(SEED)
+    docs = synthetic_lyrics(N_DOCS)
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        table = build_table(os.path.join(tmp_dir, "table"), docs)
+        for merged in (False, True):
+            if merged:
+                table.maybe_merge()
+            searcher = SPIMISearcher(table.manifest_path)
+            brute = BruteForce(docs, Exhaustive(searcher))
+            print(f"🔁 {len(searcher.segments)} segmentos{' tras maybe_merge' if merged else ''}")
+            bad_candidates = bad_ranking = 0
+            for _ in range(N_QUERIES):
+                where = random_where(rng)
+                _, _, _, _, raw_plan = parse_sql_query(f"SELECT id FROM t WHERE {where} LIMIT {TOP_K}")
+                plan = tokenize_plan(raw_plan)
+                expected = brute.candidates(raw_plan)
+                if set(searcher.candidate_docs(plan).tolist()) != expected:
+                    bad_candidates += 1
+                    print(f"     candidatos: {where}")
+                scores, _ = brute.search(raw_plan, TOP_K)
+                if not same_ranking(searcher.search_plan(plan, TOP_K), scores, TOP_K):
+                    bad_ranking += 1
+                    print(f"     ranking: {where}")
+            ok &= check(f"{N_QUERIES} planes: candidatos", bad_candidates == 0)
+            ok &= check(f"{N_QUERIES} planes: top-{TOP_K}", bad_ranking == 0)
+            for _, segment in searcher.segments:
+                segment.close()
+
+    if not ok:
+        raise SystemExit("❌ Los planes no coinciden con la fuerza bruta.")
+    print("✔ Planes booleanos y frases correctos.")
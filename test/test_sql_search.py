@@ -0,0 +1,144 @@
+import operator
+import os
+import random
+import tempfile
+import pandas as pd
+from backend.ai_query_parser import parse_sql_query
+from backend.indexing.preprocessor import preprocess
+from backend.indexing.query_plan import tokenize_plan
+from backend.indexing.search import SPIMISearcher
+from backend.metadata_store import MetadataStore
+from backend.sql_search import TableSearch
+from test.test_text_search import N_DOCS, SEED, WORDS, Exhaustive, build_table, check, same_ranking, synthetic_lyrics
+
+# Uso: python -m test.test_sql_search
+# Compara TableSearch (LIKE en varios índices de campo y comparaciones
+# resueltas en SQLite) con una evaluación por fuerza bruta con pandas.
+N_QUERIES = 300
+TOP_K = 10
+GENRES = ["pop", "rock", "jazz", "latin", "rap"]
+COMPARE = {"eq": operator.eq, "neq": operator.ne, "gt": operator.gt,
+           "gte": operator.ge, "lt": operator.lt, "lte": operator.le}
+
+
+def synthetic_table(n_docs, seed=SEED):
+    """DataFrame con dos columnas de texto y metadata numérica y categórica."""
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        "lyrics": list(synthetic_lyrics(n_docs, seed).values()),
+        "title": list(synthetic_lyrics(n_docs, seed + 1).values()),
+        "popularity": [rng.randint(0, 100) for _ in range(n_docs)],
+        "genre": [rng.choice(GENRES) for _ in range(n_docs)],
+    })
+
+
+class BruteForce:
+    """Evalúa el WHERE de parse_sql_query sobre el DataFrame y los postings."""
+
+    def __init__(self, df, exhaustive):
+        self.df = df
+        self.exhaustive = exhaustive  # {columna: Exhaustive de su índice}
+
+    def candidates(self, plan):
+        if plan[0] == "like":
+            return set().union(*(self.exhaustive[plan[1]].docs_with(t) for t in preprocess(plan[2])))
+        if plan[0] == "cmp":
+            _, op, column, value = plan
+            series = self.df[column]
+            if op == "in":
+                mask = series.isin(value)
+            elif op == "between":
+                mask = series.between(*value)
+            else:
+                mask = COMPARE[op](series, value)
+            return set(self.df.index[mask].tolist())
+        children = [self.candidates(child) for child in plan[1]]
+        return set.intersection(*children) if plan[0] == "and" else set.union(*children)
+
+    def tokens(self, plan, out):
+        if plan[0] == "like":
+            out.setdefault(plan[1], []).extend(preprocess(plan[2]))
+        elif plan[0] != "cmp":
+            for child in plan[1]:
+                self.tokens(child, out)
+        return out
+
+    def scores(self, plan):
+        """{doc: suma del coseno de cada campo} sobre los candidatos del plan."""
+        docs = self.candidates(plan)
+        scores = dict.fromkeys(docs, 0.0)
+        for column, tokens in self.tokens(plan, {}).items():
+            for doc, score in self.exhaustive[column].scores(tokens, docs).items():
+                scores[doc] += score
+        return scores
+
+
+def random_where(rng):
+    a, b, c = rng.sample(WORDS, 3)
+    g1, g2 = rng.sample(GENRES, 2)
+    p = rng.randint(0, 90)
+    return rng.choice([
+        f"lyrics LIKE '{a}' AND title LIKE '{b}'",
+        f"lyrics LIKE '{a} {b}' AND title LIKE '{c}' AND popularity > {p}",
+        f"popularity BETWEEN {p} AND {p + 10}",
+        f"genre = '{g1}' AND popularity <= {p}",
+        f"genre IN ('{g1}', '{g2}') AND popularity <> {p}",
+        f"lyrics LIKE '{a}' OR popularity >= {p + 5}",
+        f"title LIKE '{a}' OR genre = '{g1}'",
+        f"(title LIKE '{a}' OR genre = '{g1}') AND lyrics LIKE '{b}'",
+        f"lyrics LIKE '{a}' AND popularity < {p} AND genre <> '{g2}'",
+    ])
+
+
+def raises_value_error(table_search, where):
+    _, _, _, _, raw_plan = parse_sql_query(f"SELECT id FROM t WHERE {where} LIMIT {TOP_K}")
+    try:
+        table_search.search(tokenize_plan(raw_plan), TOP_K)
+    except ValueError:
+        return True
+    return False
+
+
+if __name__ == "__main__":
+    rng = random.Random(SEED)
+    df = synthetic_table(N_DOCS)
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        lyrics = build_table(os.path.join(tmp_dir, "index"), dict(enumerate(df["lyrics"])))
+        title = build_table(os.path.join(tmp_dir, "title"), dict(enumerate(df["title"])))
+        store = MetadataStore(os.path.join(tmp_dir, "metadata.db"))
+        store.replace(df)
+        field_paths = {"lyrics": lyrics.manifest_path, "title": title.manifest_path}
+        searchers = {path: SPIMISearcher(path) for path in field_paths.values()}
+        table_search = TableSearch(lyrics.manifest_path, field_paths, store, searchers.__getitem__)
+        brute = BruteForce(df, {column: Exhaustive(searchers[path]) for column, path in field_paths.items()})
+
+        print("🔁 LIKE en varios campos y comparaciones en SQLite")
+        bad_candidates = bad_ranking = 0
+        for _ in range(N_QUERIES):
+            where = random_where(rng)
+            _, _, _, _, raw_plan = parse_sql_query(f"SELECT id FROM t WHERE {where} LIMIT {TOP_K}")
+            plan = tokenize_plan(raw_plan)
+            expected = brute.scores(raw_plan)
+            if {doc for doc, _ in table_search.search(plan, N_DOCS)} != set(expected):
+                bad_candidates += 1
+                print(f"     candidatos: {where}")
+            if not same_ranking(table_search.search(plan, TOP_K), expected, TOP_K):
+                bad_ranking += 1
+                print(f"     ranking: {where}")
+        ok &= check(f"{N_QUERIES} consultas: candidatos", bad_candidates == 0)
+        ok &= check(f"{N_QUERIES} consultas: top-{TOP_K}", bad_ranking == 0)
+
+        print("🔁 Columnas inexistentes")
+        ok &= check("LIKE sobre una columna sin índice de texto", raises_value_error(table_search, "genre LIKE 'pop'"))
+        ok &= check("comparación sobre una columna que no existe", raises_value_error(table_search, "year > 2000"))
+        ok &= check("LIKE válido junto a una columna que no existe",
+                    raises_value_error(table_search, "lyrics LIKE 'love' AND year > 2000"))
+
+        for searcher in searchers.values():
+            for _, segment in searcher.segments:
+                segment.close()
+
+    if not ok:
+        raise SystemExit("❌ TableSearch no coincide con la fuerza bruta.")
+    print("✔ Búsqueda SQL correcta.")
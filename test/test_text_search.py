@@ -0,0 +1,159 @@
+import math
+import os
+import random
+import tempfile
+from collections import Counter, defaultdict
+import numpy as np
+from backend.indexing.preprocessor import preprocess
+from backend.indexing.search import SPIMISearcher
+from backend.indexing.spimi import SPIMIIndexer
+from backend.indexing.table_index import TableIndex
+
+# Uso: python -m test.test_text_search
+# Compara la búsqueda podada (MaxScore) con un cálculo exhaustivo del coseno
+# sobre una tabla sintética de varios segmentos.
+SEED = 0
+N_DOCS = 6000
+N_QUERIES = 300
+TOP_KS = [1, 5, 10, 50]
+FILLER_VOCAB = 400
+WORDS = "always love baby night young dance fire rain heart gold river star road".split()
+STOPWORDS = "i will you the is with me and in of to".split()
+# Frases que se insertan en algunas letras para que las consultas por frase encuentren algo.
+PHRASES = ["i will always love you", "love you baby", "the night is young", "dance with me",
+           "fire and rain", "heart of gold", "in the night", "love the night"]
+
+
+def synthetic_lyrics(n_docs, seed=SEED):
+    """{doc_id: texto} con frecuencias tipo Zipf y algunas frases de PHRASES."""
+    rng = random.Random(seed)
+    vocab = WORDS + STOPWORDS + [f"w{i}" for i in range(FILLER_VOCAB)]
+    rng.shuffle(vocab)
+    weights = [1 / (rank + 10) for rank in range(len(vocab))]
+    docs = {}
+    for doc in range(n_docs):
+        words = rng.choices(vocab, weights, k=rng.randint(5, 60))
+        for _ in range(rng.choice([0, 0, 1, 2])):
+            at = rng.randint(0, len(words))
+            words[at:at] = rng.choice(PHRASES).split()
+        docs[str(doc)] = " ".join(words)
+    return docs
+
+
+def build_table(index_dir, docs, parts=3, positions=True):
+    """Tabla con un replace y parts - 1 appends (sin merge)."""
+    items = list(docs.items())
+    cuts = [len(items) * i // parts for i in range(parts + 1)]
+    table = TableIndex(index_dir, positions=positions)
+    table.replace(dict(items[cuts[0]:cuts[1]]))
+    for i in range(1, parts):
+        table.append(dict(items[cuts[i]:cuts[i + 1]]))
+    return table
+
+
+class Exhaustive:
+    """Todos los postings de un SPIMISearcher en memoria, para puntuar sin podar."""
+
+    def __init__(self, searcher):
+        self.n_docs = searcher.n_docs
+        self.postings = defaultdict(dict)
+        for base, segment in searcher.segments:
+            for term, i in segment.iter_terms():
+                docs, tfs = segment.postings_at(i)
+                self.postings[term].update(zip((docs + base).tolist(), tfs.tolist()))
+        self.norms = np.concatenate([segment.norms for _, segment in searcher.segments])
+
+    def docs_with(self, term):
+        return set(self.postings.get(term, {}))
+
+    def scores(self, tokens, docs=None):
+        """{doc: coseno}; sin docs, de todos los documentos con algún término."""
+        terms, query_norm = [], 0.0
+        for term, tf in Counter(tokens).items():
+            df = len(self.postings.get(term, {}))
+            idf = math.log(self.n_docs / (1 + df))
+            query_norm += (tf * idf) ** 2
+            if df:
+                terms.append((term, idf, tf * idf))
+        query_norm = math.sqrt(query_norm)
+        if docs is None:
+            docs = set().union(*(self.docs_with(term) for term, _, _ in terms)) if terms else set()
+        if query_norm == 0:
+            return {}
+        return {
+            doc: sum(self.postings[term].get(doc, 0) * idf * wq for term, idf, wq in terms)
+            / query_norm / max(float(self.norms[doc]), 1e-6)
+            for doc in docs
+        }
+
+
+def same_ranking(got, expected, k, tol=1e-6):
+    """
+    got: [(doc, score)] del buscador; expected: {doc: score} exacto. Los
+    puntajes tienen que ser los del top-k exacto y cada doc devuelto tener su
+    puntaje exacto (a igual puntaje el orden puede variar por redondeo).
+    """
+    best = sorted(expected.values(), reverse=True)[:k]
+    if len(got) != len(best):
+        return False
+    return (all(abs(score - exp) <= tol for (_, score), exp in zip(got, best))
+            and all(abs(expected.get(doc, math.inf) - score) <= tol for doc, score in got))
+
+
+def random_queries(n_queries, seed=SEED):
+    rng = random.Random(seed)
+    vocab = WORDS + [f"w{i}" for i in range(FILLER_VOCAB)]
+    return [" ".join(rng.sample(vocab, rng.randint(1, 4))) for _ in range(n_queries)]
+
+
+def check(name, ok):
+    print(f"  {'✅' if ok else '❌'} {name}")
+    return ok
+
+
+def check_maxscore(searcher, queries):
+    exhaustive = Exhaustive(searcher)
+    bad = 0
+    for k in TOP_KS:
+        for query, hits in zip(queries, searcher.search_many(queries, top_k=k)):
+            if not same_ranking(hits, exhaustive.scores(preprocess(query)), k):
+                bad += 1
+                if bad <= 3:
+                    print(f"     k={k} '{query}': {hits[:3]}")
+    return bad == 0
+
+
+if __name__ == "__main__":
+    docs = synthetic_lyrics(N_DOCS)
+    queries = random_queries(N_QUERIES)
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print("🔁 Indexación paralela")
+        sequential, parallel = os.path.join(tmp_dir, "seq.bin"), os.path.join(tmp_dir, "par.bin")
+        SPIMIIndexer(sequential, positions=True).index_documents(docs)
+        SPIMIIndexer(parallel, positions=True, n_workers=2, chunk_size=700).index_documents(docs)
+        with open(sequential, "rb") as a, open(parallel, "rb") as b:
+            ok &= check("segmento idéntico al secuencial", a.read() == b.read())
+
+        print("🔁 MaxScore vs coseno exhaustivo")
+        table = build_table(os.path.join(tmp_dir, "table"), docs)
+        searcher = SPIMISearcher(table.manifest_path)
+        ok &= check(f"{len(queries)} consultas x k={TOP_KS}, {len(searcher.segments)} segmentos",
+                    check_maxscore(searcher, queries))
+
+        print("🔁 Normas tras append + maybe_merge")
+        table.maybe_merge()
+        fresh = TableIndex(os.path.join(tmp_dir, "fresh"))
+        fresh.replace(docs)
+        merged, rebuilt = SPIMISearcher(table.manifest_path), SPIMISearcher(fresh.manifest_path)
+        norms = np.concatenate([segment.norms for _, segment in merged.segments])
+        ok &= check("iguales a reconstruir la tabla",
+                    np.allclose(norms, rebuilt.segments[0][1].norms, rtol=1e-6))
+        ok &= check(f"{len(queries)} consultas tras el merge", check_maxscore(merged, queries))
+        for reader in (searcher, merged, rebuilt):
+            for _, segment in reader.segments:
+                segment.close()
+
+    if not ok:
+        raise SystemExit("❌ La búsqueda no coincide con el cálculo exhaustivo.")
+    print("✔ Búsqueda de texto correcta.")